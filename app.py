@@ -1,7 +1,9 @@
-# 导入基础控制器库
-from base_ctrl import BaseController
 import threading
 import yaml, os
+from boot_ctrl import Startup
+
+# 启动计时, 各子系统按依赖并行初始化
+startup = Startup()
 
 # 检查是否为树莓派5
 def is_raspberry_pi5():
@@ -13,45 +15,29 @@ def is_raspberry_pi5():
                 else:
                     return False
 
-# 根据树莓派型号选择串口
-if is_raspberry_pi5():
-    base = BaseController('/dev/ttyAMA0', 115200)
-else:
-    base = BaseController('/dev/serial0', 115200)
-
-# 启动呼吸灯线程
-threading.Thread(target=lambda: base.breath_light(15), daemon=True).start()
-
 # 读取配置文件
 curpath = os.path.realpath(__file__)
 thisPath = os.path.dirname(curpath)
 with open(thisPath + '/config.yaml', 'r') as yaml_file:
     f = yaml.safe_load(yaml_file)
 
-# OLED显示初始化信息
-base.base_oled(0, f["base_config"]["robot_name"])
-base.base_oled(1, f"sbc_version: {f['base_config']['sbc_version']}")
-base.base_oled(2, f"{f['base_config']['main_type']}{f['base_config']['module_type']}")
-base.base_oled(3, "Starting...")
+# 子系统对象, 由启动步骤创建
+base = None
+cvf = None
+si = None
+audio_ctrl = None
 
 # 导入Flask及相关库
 from flask import Flask, render_template, Response, request, jsonify, redirect, url_for, send_from_directory, send_file
 from flask_socketio import SocketIO, emit
 from werkzeug.utils import secure_filename
-from aiortc import RTCPeerConnection, RTCSessionDescription
 import json
 import uuid
 import asyncio
 import time
 import logging
-import logging
-import cv_ctrl
-import audio_ctrl
-import os_info
 
-# 获取系统信息
 UPLOAD_FOLDER = thisPath + '/sounds/others'
-si = os_info.SystemInfo()
 
 # 创建Flask应用和SocketIO
 app = Flask(__name__)
@@ -62,9 +48,6 @@ active_pcs = {}
 MAX_CONNECTIONS = 1
 pcs = set()
 
-# 相机控制对象
-cvf = cv_ctrl.OpencvFuncs(thisPath, base)
-
 # 命令与动作映射表
 cmd_actions = {
     # 缩放控制
@@ -73,7 +56,7 @@ cmd_actions = {
     f['code']['zoom_x4']: lambda: cvf.scale_ctrl(4),
 
     # 图片和视频控制
-    f['code']['pic_cap']: cvf.picture_capture,
+    f['code']['pic_cap']: lambda: cvf.picture_capture(),
     f['code']['vid_sta']: lambda: cvf.video_record(True),
     f['code']['vid_end']: lambda: cvf.video_record(False),
 
@@ -112,7 +95,7 @@ cmd_actions = {
     f['code']['base_of']: lambda: base.lights_ctrl(0, base.head_light_status),
     f['code']['base_on']: lambda: base.lights_ctrl(255, base.head_light_status),
     f['code']['head_ct']: lambda: cvf.head_light_ctrl(3),
-    f['code']['base_ct']: base.base_lights_ctrl
+    f['code']['base_ct']: lambda: base.base_lights_ctrl()
 }
 
 # 需要反馈的命令动作
@@ -139,12 +122,76 @@ def process_cv_info(cmd):
 def generate_frames():
     while True:
         frame = cvf.frame_process()
+        startup.mark('first_frame')
         try:
             yield (b'--frame\r\n'
                b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n') 
         except Exception as e:
             print("An [generate_frames] error occurred:", e)
 
+# 检测结果推送
+def detections_loop():
+    # 每个阶段单独比较, 只推送有变化的结果
+    last_sent = {}
+    while True:
+        detections = dict(cvf.detections)
+        for stage_name in list(last_sent):
+            if stage_name not in detections:
+                socketio.emit('detections', cvf.stage_detections_dict(stage_name), namespace='/detections')
+                del last_sent[stage_name]
+        for stage_name, stage_detections in detections.items():
+            if stage_name not in last_sent or stage_detections.changed(last_sent[stage_name]):
+                socketio.emit('detections', stage_detections.to_dict(), namespace='/detections')
+                last_sent[stage_name] = stage_detections
+        time.sleep(1 / f['cv']['detection_rate'])
+
+# 检测结果轮询
+@app.route('/detections')
+def get_detections():
+    return jsonify(cvf.detections_dict())
+
+# 核心子系统就绪前, 请求先等待
+@app.before_request
+def wait_for_boot():
+    if request.endpoint == 'get_boot_metrics':
+        return
+    if not startup.wait('serial', 'system_info', 'audio', 'camera', timeout=30):
+        return jsonify({"status": "error", "message": "starting"}), 503
+
+# 视觉流水线状态
+@app.route('/cv_stages')
+def get_cv_stages():
+    return jsonify(cvf.cv_pipeline.stats())
+
+# 模型加载状态: 加载耗时, 内存, 空闲时间
+@app.route('/cv_models')
+def get_cv_models():
+    return jsonify(cvf.models.stats())
+
+# 目标跟踪统计: 各类别数量和跟踪时长
+@app.route('/cv_objects')
+def get_cv_objects():
+    return jsonify(cvf.object_track.stats(cvf.class_names))
+
+# 云台跟踪状态: 目标角速度, 发送和抑制的命令数
+@app.route('/cv_gimbal')
+def get_cv_gimbal():
+    return jsonify(cvf.gimbal.stats())
+
+# 启动时间线: 各子系统耗时, 首帧和首条命令时间
+@app.route('/metrics/boot')
+def get_boot_metrics():
+    return jsonify(startup.timeline())
+
+# 帧处理耗时统计
+@app.route('/metrics/pipeline')
+def get_pipeline_metrics():
+    metrics = cvf.profiler.stats()
+    metrics['video_fps'] = cvf.video_fps
+    if cvf.camera is not None:
+        metrics['camera'] = cvf.camera.stats()
+    return jsonify(metrics)
+
 # 主页路由
 @app.route('/')
 def index():
@@ -214,6 +261,7 @@ def manage_connections(pc_id):
 
 # WebRTC offer处理
 async def offer_async():
+    from aiortc import RTCPeerConnection, RTCSessionDescription
     params = await request.json
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
     pc = RTCPeerConnection()
@@ -315,6 +363,21 @@ def cmdline_ctrl(args_string):
             cvf.change_target_color(lower_nums, upper_nums)
         elif args[1] == '-s' or args[1] == '--select':
             cvf.selet_target_color(args[2])
+        elif args[1] == '-a' or args[1] == '--add':
+            try:
+                rate = float(args[3]) if len(args) > 3 else None
+                priority = int(args[4]) if len(args) > 4 else None
+            except:
+                return
+            cvf.add_cv_stage(args[2], rate, priority)
+        elif args[1] == '-d' or args[1] == '--drop':
+            cvf.remove_cv_stage(args[2])
+        elif args[1] == '-p' or args[1] == '--process_scale':
+            try:
+                float(args[3])
+            except:
+                return
+            cvf.set_process_scale(args[2], float(args[3]))
 
     # 视频控制命令
     elif args[0] == 'video' or args[0] == 'v':
@@ -324,6 +387,15 @@ def cmdline_ctrl(args_string):
             except:
                 return
             cvf.set_video_quality(int(args[2]))
+        elif args[1] == '-p' or args[1] == '--profile':
+            if args[2] == 'on':
+                cvf.profiler.set_enabled(True)
+            elif args[2] == 'off':
+                cvf.profiler.set_enabled(False)
+                cvf.profile_hud = False
+            elif args[2] == 'hud':
+                cvf.profiler.set_enabled(True)
+                cvf.profile_hud = True
 
     # 线路控制命令
     elif args[0] == 'line':
@@ -357,6 +429,15 @@ def cmdline_ctrl(args_string):
                 return
             cvf.set_line_track_args(float(args[2]), float(args[3]), float(args[4]), float(args[5]), float(args[6]), float(args[7]), float(args[8]))
 
+    # 拍照命令
+    elif args[0] == 'photo':
+        if args[1] == '-b' or args[1] == '--burst':
+            try:
+                burst_count = int(args[2])
+            except:
+                return
+            cvf.picture_burst(burst_count)
+
     # 跟踪控制命令
     elif args[0] == 'track':
         cvf.set_pt_track_args(args[1], args[2])
@@ -423,6 +504,7 @@ def video_feed():
 @app.route('/send_command', methods=['POST'])
 def handle_command():
     command = request.form['command']
+    startup.mark('first_command')
     print("Received command:", command)
     cvf.info_update("CMD:" + command, (0,255,255), 0.36)
     try:
@@ -468,6 +550,8 @@ def serve_static_settings(filename):
 # WebSocket处理
 @socketio.on('json', namespace='/json')
 def handle_socket_json(json):
+    startup.wait('serial')
+    startup.mark('first_command')
     try:
         base.base_json_ctrl(json)
     except Exception as e:
@@ -545,6 +629,8 @@ def base_data_loop():
 # WebSocket命令处理
 @socketio.on('message', namespace='/ctrl')
 def handle_socket_cmd(message):
+    startup.wait('serial', 'camera')
+    startup.mark('first_command')
     try:
         json_data = json.loads(message)
     except json.JSONDecodeError:
@@ -558,6 +644,13 @@ def handle_socket_cmd(message):
     if cmd_a in cmd_feedback_actions:
         threading.Thread(target=update_data_websocket_single, daemon=True).start()
 
+# 检测结果连接, 先发送当前结果
+@socketio.on('connect', namespace='/detections')
+def handle_detections_connect():
+    startup.wait('camera')
+    for record in cvf.detections_dict()['stages'].values():
+        emit('detections', record)
+
 # 启动命令
 def cmd_on_boot():
     cmd_list = [
@@ -574,36 +667,80 @@ def cmd_on_boot():
         cvf.info_update(cmd_list[i], (0,255,255), 0.36)
     set_version(f['base_config']['main_type'], f['base_config']['module_type'])
 
-# 主程序入口
-if __name__ == "__main__":
-    # 关闭灯光
+# 串口初始化: 根据树莓派型号选择串口, 呼吸灯, OLED显示初始化信息
+def init_serial():
+    global base
+    from base_ctrl import BaseController
+    if is_raspberry_pi5():
+        base = BaseController('/dev/ttyAMA0', 115200)
+    else:
+        base = BaseController('/dev/serial0', 115200)
+    threading.Thread(target=lambda: base.breath_light(15), daemon=True).start()
+    base.base_oled(0, f["base_config"]["robot_name"])
+    base.base_oled(1, f"sbc_version: {f['base_config']['sbc_version']}")
+    base.base_oled(2, f"{f['base_config']['main_type']}{f['base_config']['module_type']}")
+    base.base_oled(3, "Starting...")
+    # 启动期间打开灯光
     base.lights_ctrl(255, 255)
-    
-    # 播放启动音频
-    audio_ctrl.play_random_audio("robot_started", False)
 
-    # 更新视频和图片大小
+# 系统信息, 更新视频和图片大小
+def init_system_info():
+    global si
+    import os_info
+    si = os_info.SystemInfo()
     si.update_folder(thisPath)
 
-    # 云台/机械臂向前看
+# 音频初始化, 播放启动音频
+def init_audio():
+    global audio_ctrl
+    import audio_ctrl
+    audio_ctrl.play_random_audio("robot_started", False)
+
+# 相机和视觉
+def init_camera():
+    global cvf
+    import cv_ctrl
+    cvf = cv_ctrl.OpencvFuncs(thisPath, base)
+
+# 模型预加载, 等首帧之后再加载, 不和启动抢资源
+def init_models():
+    if not f['cv']['model_prewarm']:
+        return
+    startup.wait_mark('first_frame', f['cv']['model_prewarm_delay'])
+    cvf.models.prewarm(f['cv']['model_prewarm']).join()
+
+# 云台/机械臂向前看
+def init_gimbal():
     if f['base_config']['module_type'] == 1:
         base.base_json_ctrl({"T":f['cmd_config']['cmd_arm_ctrl_ui'],"E":f['args_config']['arm_default_e'],"Z":f['args_config']['arm_default_z'],"R":f['args_config']['arm_default_r']})
     else:
         base.gimbal_ctrl(0, 0, 200, 10)
 
-    # 启动反馈循环
+# 启动反馈循环, 基础数据更新和检测结果推送
+def start_feedback():
     si.start()
     si.resume()
-    data_update_thread = threading.Thread(target=update_data_loop, daemon=True)
-    data_update_thread.start()
+    threading.Thread(target=update_data_loop, daemon=True).start()
+    threading.Thread(target=base_data_loop, daemon=True).start()
+    threading.Thread(target=detections_loop, daemon=True).start()
 
-    # 启动基础数据更新
-    base_update_thread = threading.Thread(target=base_data_loop, daemon=True)
-    base_update_thread.start()
-
-    # 关闭灯光
+# 关闭灯光, 发送启动命令
+def init_boot_cmds():
     base.lights_ctrl(0, 0)
     cmd_on_boot()
 
+# 主程序入口
+if __name__ == "__main__":
+    # 互不依赖的子系统并行启动, web服务不等待启动完成
+    startup.add('serial', init_serial)
+    startup.add('system_info', init_system_info)
+    startup.add('audio', init_audio)
+    startup.add('camera', init_camera, deps=('serial',))
+    startup.add('models', init_models, deps=('camera',))
+    startup.add('gimbal', init_gimbal, deps=('serial',))
+    startup.add('feedback', start_feedback, deps=('serial', 'system_info', 'camera'))
+    startup.add('boot_cmds', init_boot_cmds, deps=('gimbal', 'camera'))
+    startup.run()
+
     # 运行主Web应用
     socketio.run(app, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
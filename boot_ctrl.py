@@ -0,0 +1,106 @@
+import threading
+import time
+
+
+class BootStep():
+    """one subsystem of the startup, func runs once all deps are done"""
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.done = threading.Event()
+        self.start = None
+        self.end = None
+        self.result = None
+        self.error = None
+
+    def stats(self, t0):
+        return {
+            'deps': list(self.deps),
+            'start_ms': round((self.start - t0) * 1000, 1) if self.start else None,
+            'end_ms': round((self.end - t0) * 1000, 1) if self.end else None,
+            'duration_ms': round((self.end - self.start) * 1000, 1) if self.end else None,
+            'error': str(self.error) if self.error else None
+        }
+
+
+class Startup():
+    """starts independent subsystems in parallel, each step gets its own thread
+    and waits for the steps it depends on. a failed step still counts as done,
+    so its dependents run and deal with the missing subsystem themselves.
+    mark() stamps one off milestones like the first frame or the first command,
+    everything is timed from when the Startup was created."""
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.steps = {}
+        self.marks = {}
+        self.marked = threading.Condition()
+
+    def add(self, name, func, deps=()):
+        for dep in deps:
+            if dep not in self.steps:
+                raise ValueError(f"boot step {name} depends on unknown step {dep}")
+        self.steps[name] = BootStep(name, func, deps)
+
+    def run(self):
+        for step in self.steps.values():
+            threading.Thread(target=self.run_step, args=(step,), daemon=True, name='boot_' + step.name).start()
+
+    def run_step(self, step):
+        for dep in step.deps:
+            self.steps[dep].done.wait()
+        step.start = time.perf_counter()
+        try:
+            step.result = step.func()
+        except Exception as e:
+            step.error = e
+            print(f"[boot_ctrl.run_step] {step.name} error: {e}")
+        step.end = time.perf_counter()
+        step.done.set()
+        if self.finished() and self.mark('boot'):
+            self.report()
+
+    def wait(self, *names, timeout=None):
+        # -> True once all the named steps are done
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for name in names:
+            remaining = None if deadline is None else max(0, deadline - time.perf_counter())
+            if not self.steps[name].done.wait(remaining):
+                return False
+        return True
+
+    def finished(self):
+        return all(step.done.is_set() for step in self.steps.values())
+
+    def mark(self, name):
+        # only the first call counts -> True for that one
+        if name in self.marks:
+            return False
+        with self.marked:
+            if name in self.marks:
+                return False
+            self.marks[name] = time.perf_counter()
+            self.marked.notify_all()
+        print(f"[boot_ctrl] {name} at {round((self.marks[name] - self.t0) * 1000, 1)}ms")
+        return True
+
+    def wait_mark(self, name, timeout=None):
+        # -> True once name was marked
+        with self.marked:
+            return self.marked.wait_for(lambda: name in self.marks, timeout)
+
+    def timeline(self):
+        return {
+            'finished': self.finished(),
+            'steps': {name: step.stats(self.t0) for name, step in self.steps.items()},
+            'marks': {name: round((mark - self.t0) * 1000, 1) for name, mark in list(self.marks.items())}
+        }
+
+    def report(self):
+        timeline = self.timeline()
+        print("[boot_ctrl] boot timeline (ms)")
+        for name, step in sorted(timeline['steps'].items(), key=lambda item: item[1]['start_ms'] or 0):
+            print(f"  {name:<12}{step['start_ms']:>9} -> {step['end_ms']:>9}  {step['duration_ms']:>8}"
+                  + (f"  error: {step['error']}" if step['error'] else ""))
+        for name, mark in timeline['marks'].items():
+            print(f"  {name:<12}{mark:>9}")
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""offline benchmark for the cv modes.
+replays a video file or a directory of images through the OpencvFuncs
+handlers without a camera or a robot, every mode runs in its own process.
+
+    python3 cv_bench.py media/test.mp4
+    python3 cv_bench.py frames/ --modes faces color line --frames 300 --json bench.json
+    python3 cv_bench.py media/test.mp4 --dnn --frames 100
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import time
+
+import cv2
+
+from cv_profile import Histogram
+
+curpath = os.path.realpath(__file__)
+thisPath = os.path.dirname(curpath)
+
+MODES = ['motion', 'faces', 'objects', 'color', 'hands', 'line', 'mp_faces', 'pose']
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+class BenchLidar():
+    lidar_angles_show = []
+    lidar_distances_show = []
+
+
+class BenchBaseCtrl():
+    """stands in for base_ctrl.BaseController, keeps what would have been sent"""
+    def __init__(self):
+        self.base_light_status = 0
+        self.head_light_status = 0
+        self.rl = BenchLidar()
+        self.commands = []
+        self.frame_index = 0
+
+    def base_json_ctrl(self, input_json):
+        self.commands.append((self.frame_index, input_json))
+
+    def lights_ctrl(self, pwmA, pwmB):
+        self.base_light_status = pwmA
+        self.head_light_status = pwmB
+        self.commands.append((self.frame_index, {"T": "lights", "A": pwmA, "B": pwmB}))
+
+
+def read_frames(source, max_frames=None, size=(640, 480)):
+    # -> frames as the camera would deliver them, resized to the stream size
+    if os.path.isdir(source):
+        names = sorted(name for name in os.listdir(source) if name.lower().endswith(IMAGE_EXTS))
+        for i, name in enumerate(names):
+            if max_frames and i >= max_frames:
+                return
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield cv2.resize(frame, size)
+        return
+    capture = cv2.VideoCapture(source)
+    count = 0
+    try:
+        while not max_frames or count < max_frames:
+            success, frame = capture.read()
+            if not success:
+                return
+            count += 1
+            yield cv2.resize(frame, size)
+    finally:
+        capture.release()
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def send_due_commands(cvf, now):
+    # the command threads are off in the bench, what they would send goes out
+    # once per frame, so commands are counted per frame and not by wall clock
+    for controller in (cvf.line_follower, cvf.gimbal):
+        command = controller.step(now)
+        if command is not None:
+            controller.send(*command)
+
+
+def bench_mode(mode, source, max_frames, unlock, keep_commands):
+    # runs in a child process, so models and peak rss belong to this mode only
+    import cv_ctrl
+    from cv_worker import CvFrame
+    base_ctrl = BenchBaseCtrl()
+    setup_start = time.perf_counter()
+    cvf = cv_ctrl.OpencvFuncs(thisPath, base_ctrl, camera=False)
+    cvf.cv_movtion_lock = not unlock
+    cvf.line_follower.threaded = False
+    cvf.gimbal.threaded = False
+    setup_time = time.perf_counter() - setup_start
+    setup_rss = peak_rss_mb()
+    handler = cvf.cv_stage_funcs[mode]
+    latency = Histogram()
+    detected = 0
+    errors = 0
+    total_ns = 0
+    for seq, frame in enumerate(read_frames(source, max_frames), 1):
+        base_ctrl.frame_index = seq
+        frame_time = time.time()
+        start = time.perf_counter_ns()
+        try:
+            detections = handler(cvf.make_prep(CvFrame(frame, seq, frame_time)))
+        except Exception as e:
+            errors += 1
+            detections = None
+            if errors == 1:
+                print(f"[cv_bench.bench_mode] {mode} error: {e}")
+        elapsed = time.perf_counter_ns() - start
+        send_due_commands(cvf, frame_time)
+        latency.record(elapsed)
+        total_ns += elapsed
+        if detections is not None and len(detections):
+            detected += 1
+    command_counts = {}
+    for frame_index, command in base_ctrl.commands:
+        command_counts[str(command.get("T"))] = command_counts.get(str(command.get("T")), 0) + 1
+    report = {
+        'mode': mode,
+        'frames': latency.count,
+        'frames_detected': detected,
+        'errors': errors,
+        'fps': round(latency.count / (total_ns / 1e9), 2) if total_ns else 0,
+        'latency': latency.summary(),
+        'setup_s': round(setup_time, 3),
+        'setup_rss_mb': setup_rss,
+        'peak_rss_mb': peak_rss_mb(),
+        'command_counts': command_counts
+    }
+    if keep_commands:
+        report['commands'] = base_ctrl.commands
+    return report
+
+
+def run_mode(args):
+    result_queue, mode, source, max_frames, unlock, keep_commands = args
+    try:
+        result_queue.put(bench_mode(mode, source, max_frames, unlock, keep_commands))
+    except Exception as e:
+        result_queue.put({'mode': mode, 'error': str(e)})
+
+
+def wait_report(process, result_queue, mode, timeout):
+    # a mode that crashes (a segfault in a native lib, the oom killer) or hangs
+    # gets a failed report instead of blocking the modes after it
+    deadline = time.time() + timeout if timeout else None
+    while True:
+        try:
+            return result_queue.get(timeout=1)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            try:
+                # the report may still be on its way out of the exited process
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                return {'mode': mode, 'error': f'process exited with code {process.exitcode}'}
+        if deadline is not None and time.time() > deadline:
+            process.terminate()
+            return {'mode': mode, 'error': f'no report after {timeout} s'}
+
+
+def print_table(reports):
+    # fps and latency of a mode with errors are not comparable, they are left out
+    print(f"{'mode':<10}{'frames':>7}{'errors':>7}{'fps':>9}{'p50':>8}{'p95':>8}{'max':>8}{'rss_mb':>9}  commands")
+    for report in reports:
+        if 'error' in report:
+            print(f"{report['mode']:<10} failed: {report['error']}")
+            continue
+        latency = report['latency']
+        if report['errors']:
+            timing = f"{'-':>9}{'-':>8}{'-':>8}{'-':>8}"
+        else:
+            timing = f"{report['fps']:>9.1f}{latency['p50_ms']:>8.2f}{latency['p95_ms']:>8.2f}{latency['max_ms']:>8.2f}"
+        print(f"{report['mode']:<10}{report['frames']:>7}{report['errors']:>7}{timing}"
+              f"{report['peak_rss_mb']:>9.1f}  {report['command_counts']}")
+
+
+def bench_dnn(source, max_frames):
+    # every cv.object_backends entry on the same frames, the pick is saved for object_backend auto
+    import cv_detect
+    import cv_dnn
+    cv_detect.set_opencv_threads()
+    frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in read_frames(source, max_frames)]
+    reports = cv_dnn.benchmark(cv_dnn.f['cv']['object_backends'], frames, thisPath)
+    selected = cv_dnn.select_backend(reports)
+    print(f"{'backend':<14}{'load_ms':>9}{'mean':>8}{'p50':>8}{'p95':>8}{'acc':>7}{'min':>7}")
+    for report in reports:
+        if 'error' in report:
+            print(f"{report['name']:<14} failed: {report['error']}")
+            continue
+        latency = report['latency']
+        print(f"{report['name']:<14}{report['load_ms']:>9.1f}{latency['mean_ms']:>8.2f}{latency['p50_ms']:>8.2f}"
+              f"{latency['p95_ms']:>8.2f}{report['accuracy']:>7.3f}{report['min_accuracy']:>7.2f}"
+              + ('  <- selected' if report['name'] == selected else ''))
+    if selected is not None:
+        cv_dnn.save_selection(thisPath, selected, reports)
+    else:
+        print("no backend met its accuracy threshold, nothing saved")
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='replay recorded frames through the cv modes')
+    parser.add_argument('source', help='video file or directory of images')
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--frames', type=int, default=0, help='stop after this many frames, 0 for all')
+    parser.add_argument('--locked', action='store_true', help='keep cv_movtion_lock on, no gimbal or drive commands')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds a mode may take before it counts as failed, 0 for no limit')
+    parser.add_argument('--json', help='write the full report, including every command, to this file')
+    parser.add_argument('--dnn', action='store_true',
+                        help='compare the object detector backends instead of the modes, the fastest accurate one is kept for object_backend auto')
+    args = parser.parse_args()
+
+    if args.dnn:
+        reports = bench_dnn(args.source, args.frames or 100)
+        if args.json:
+            with open(args.json, 'w') as json_file:
+                json.dump(reports, json_file, indent=2)
+        return
+
+    ctx = multiprocessing.get_context('fork')
+    result_queue = ctx.Queue()
+    reports = []
+    for mode in args.modes:
+        process = ctx.Process(target=run_mode,
+                              args=((result_queue, mode, args.source, args.frames, not args.locked, bool(args.json)),))
+        process.start()
+        report = wait_report(process, result_queue, mode, args.timeout)
+        process.join()
+        reports.append(report)
+    print_table(reports)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(reports, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
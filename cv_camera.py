@@ -0,0 +1,462 @@
+import fcntl
+import glob
+import json
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+from cv_profile import Histogram
+
+
+class CameraSource():
+    """one camera behind a common interface.
+    capture() -> (frame, lores), lores is None unless the source has a second
+    small yuv420 stream. timestamp is when the last frame was taken, as
+    time.time(). read_latency covers the blocking read, sensor_latency the
+    time from exposure to delivery for sources that report it."""
+    name = 'none'
+    native_format = 'BGR888'
+
+    def __init__(self, size=(640, 480)):
+        self.size = size
+        self.timestamp = 0
+        self.frames = 0
+        self.read_latency = Histogram()
+        self.sensor_latency = None
+
+    def open(self):
+        # -> True when the camera is there and streaming
+        return False
+
+    def read(self):
+        raise NotImplementedError
+
+    def capture(self):
+        start = time.perf_counter_ns()
+        frame, lores = self.read()
+        self.read_latency.record(time.perf_counter_ns() - start)
+        if not self.sensor_latency or not self.sensor_latency.count:
+            self.timestamp = time.time()
+        self.frames += 1
+        return frame, lores
+
+    def record_sensor_latency(self, latency_ns):
+        if self.sensor_latency is None:
+            self.sensor_latency = Histogram()
+        self.sensor_latency.record(latency_ns)
+        self.timestamp = time.time() - latency_ns / 1e9
+
+    def fit(self, frame, lores, zoom_crop, zoomed):
+        # apply the digital zoom, a zoomed frame no longer matches the lores field of view
+        return zoom_crop(frame), None if zoomed else lores
+
+    def set_zoom(self, rate):
+        # -> True when the camera zooms itself and fit() must not crop again
+        return False
+
+    def start_hw_record(self, filename):
+        # -> True when the camera records to filename on its own
+        return False
+
+    def stop_hw_record(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        stats = {
+            'source': self.name,
+            'format': self.native_format,
+            'frames': self.frames,
+            'read': self.read_latency.summary()
+        }
+        if self.sensor_latency is not None:
+            stats['sensor'] = self.sensor_latency.summary()
+        return stats
+
+
+class V4L2Source(CameraSource):
+    """usb camera through opencv"""
+    name = 'v4l2'
+
+    def __init__(self, size=(640, 480), device=0):
+        super(V4L2Source, self).__init__(size)
+        self.device = device
+        self.camera = None
+
+    def open(self):
+        # a capture that failed is released, so the device is free for the next candidate
+        self.camera = cv2.VideoCapture(self.device)
+        try:
+            if not self.camera.isOpened():
+                self.close()
+                return False
+            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.size[0])
+            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.size[1])
+            fourcc = int(self.camera.get(cv2.CAP_PROP_FOURCC))
+            if fourcc:
+                self.native_format = ''.join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4))
+            return True
+        except Exception as e:
+            print(f"[cv_camera.V4L2Source.open] error: {e}")
+            self.close()
+            return False
+
+    def read(self):
+        success, frame = self.camera.read() if self.camera is not None else (False, None)
+        if not success:
+            self.close()
+            time.sleep(1)
+            self.open()
+            raise RuntimeError('usb camera read failed')
+        return frame, None
+
+    def close(self):
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+
+
+class Picamera2Source(CameraSource):
+    """csi camera, main XRGB8888 stream plus an optional lores YUV420 stream for cv"""
+    name = 'picamera2'
+    native_format = 'XRGB8888'
+
+    def __init__(self, size=(640, 480), lores_size=None, bitrate=1000000):
+        super(Picamera2Source, self).__init__(size)
+        self.lores_size = lores_size
+        self.bitrate = bitrate
+        self.picam2 = None
+        self.encoder = None
+        self.zoomed_by_sensor = False
+
+    def open(self):
+        try:
+            from picamera2 import Picamera2
+            from picamera2.encoders import H264Encoder
+            self.encoder = H264Encoder(self.bitrate)
+            self.picam2 = Picamera2()
+            if self.lores_size:
+                # the isp scales a second yuv stream for cv, main only goes to display, recording and photos
+                self.picam2.configure(self.picam2.create_video_configuration(
+                    main={"format": 'XRGB8888', "size": self.size},
+                    lores={"format": 'YUV420', "size": self.lores_size}))
+            else:
+                self.picam2.configure(self.picam2.create_video_configuration(main={"format": 'XRGB8888', "size": self.size}))
+            self.picam2.start()
+            return True
+        except Exception as e:
+            print(f"[cv_camera.Picamera2Source.open] error: {e}")
+            self.close()
+            return False
+
+    def read(self):
+        if self.lores_size:
+            (frame, lores), metadata = self.picam2.capture_arrays(["main", "lores"])
+        else:
+            (frame,), metadata = self.picam2.capture_arrays(["main"])
+            lores = None
+        if 'SensorTimestamp' in metadata:
+            # libcamera stamps the start of exposure on CLOCK_BOOTTIME
+            self.record_sensor_latency(time.clock_gettime_ns(time.CLOCK_BOOTTIME) - metadata['SensorTimestamp'])
+        return frame, lores
+
+    def fit(self, frame, lores, zoom_crop, zoomed):
+        if self.zoomed_by_sensor:
+            return frame, lores
+        return super(Picamera2Source, self).fit(frame, lores, zoom_crop, zoomed)
+
+    def set_zoom(self, rate):
+        # let the ISP crop the sensor, the zoomed region still comes out at full resolution
+        try:
+            crop_x, crop_y, crop_w, crop_h = self.picam2.camera_properties['ScalerCropMaximum']
+            zoom_w = int(crop_w / rate)
+            zoom_h = int(crop_h / rate)
+            self.picam2.set_controls({"ScalerCrop": (crop_x + (crop_w - zoom_w) // 2, crop_y + (crop_h - zoom_h) // 2, zoom_w, zoom_h)})
+            self.zoomed_by_sensor = rate != 1
+        except Exception as e:
+            print(f"[cv_camera.Picamera2Source.set_zoom] error: {e}")
+            self.zoomed_by_sensor = False
+        return self.zoomed_by_sensor
+
+    def start_hw_record(self, filename):
+        # hardware h264 straight from the isp, recorded without overlays
+        try:
+            from picamera2.outputs import FfmpegOutput
+            self.picam2.start_encoder(self.encoder, FfmpegOutput(filename))
+            return True
+        except Exception as e:
+            print(f"[cv_camera.Picamera2Source.start_hw_record] error: {e}")
+            return False
+
+    def stop_hw_record(self):
+        self.picam2.stop_encoder()
+
+    def close(self):
+        # also after a failed open, the camera stays claimed until it is closed
+        if self.picam2 is not None:
+            try:
+                self.picam2.stop()
+                self.picam2.close()
+            except Exception as e:
+                print(f"[cv_camera.Picamera2Source.close] error: {e}")
+            self.picam2 = None
+
+
+class DepthAISource(CameraSource):
+    """oak camera, 720p color stream cropped for zoom and resized to size"""
+    name = 'depthai'
+    native_format = 'NV12'
+
+    def __init__(self, size=(640, 480)):
+        super(DepthAISource, self).__init__(size)
+        self.device = None
+        self.output_queue = None
+
+    def open(self):
+        try:
+            import depthai as dai
+            self.dai = dai
+            pipeline = dai.Pipeline()
+            cam_rgb = pipeline.createColorCamera()
+            cam_rgb.setBoardSocket(dai.CameraBoardSocket.RGB)
+            cam_rgb.setInterleaved(False)
+            cam_rgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_720_P)
+            xout = pipeline.createXLinkOut()
+            xout.setStreamName("video")
+            cam_rgb.video.link(xout.input)
+            self.device = dai.Device(pipeline)
+            self.output_queue = self.device.getOutputQueue(name="video", maxSize=8, blocking=False)
+            return True
+        except Exception as e:
+            print(f"[cv_camera.DepthAISource.open] error: {e}")
+            self.close()
+            return False
+
+    def read(self):
+        img_frame = self.output_queue.get()
+        try:
+            # device timestamps are synced to the host clock
+            self.record_sensor_latency(int((self.dai.Clock.now() - img_frame.getTimestamp()).total_seconds() * 1e9))
+        except Exception:
+            pass
+        return img_frame.getCvFrame(), None
+
+    def fit(self, frame, lores, zoom_crop, zoomed):
+        # crop the native frame before resizing, zoomed output keeps full detail
+        return cv2.resize(zoom_crop(frame, False), self.size), None
+
+    def close(self):
+        if self.device is not None:
+            self.device.close()
+            self.device = None
+
+
+class FileSource(CameraSource):
+    """replays a video file in a loop at its own frame rate"""
+    name = 'file'
+
+    def __init__(self, size=(640, 480), filename=None, realtime=True):
+        super(FileSource, self).__init__(size)
+        self.filename = filename
+        self.realtime = realtime
+        self.capture_file = None
+        self.frame_interval = 0
+        self.next_frame_time = 0
+
+    def open(self):
+        if not self.filename or not os.path.exists(self.filename):
+            return False
+        self.capture_file = cv2.VideoCapture(self.filename)
+        fps = self.capture_file.get(cv2.CAP_PROP_FPS)
+        self.frame_interval = 1 / fps if fps and self.realtime else 0
+        return self.capture_file.isOpened()
+
+    def read(self):
+        if self.frame_interval:
+            delay = self.next_frame_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame_time = max(self.next_frame_time + self.frame_interval, time.time())
+        success, frame = self.capture_file.read()
+        if not success:
+            self.capture_file.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture_file.read()
+            if not success:
+                raise RuntimeError(f'cannot read {self.filename}')
+        if (frame.shape[1], frame.shape[0]) != tuple(self.size):
+            frame = cv2.resize(frame, self.size)
+        return frame, None
+
+    def close(self):
+        if self.capture_file is not None:
+            self.capture_file.release()
+
+
+class SyntheticSource(CameraSource):
+    """generated test pattern, a moving ball and a frame counter over color bars"""
+    name = 'synthetic'
+
+    def __init__(self, size=(640, 480), fps=30):
+        super(SyntheticSource, self).__init__(size)
+        self.frame_interval = 1 / fps if fps else 0
+        self.next_frame_time = 0
+        w, h = size
+        bar_colors = [(255, 255, 255), (0, 255, 255), (255, 255, 0), (0, 255, 0),
+                      (255, 0, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0)]
+        self.background = np.zeros((h, w, 3), dtype=np.uint8)
+        for i, color in enumerate(bar_colors):
+            self.background[:, i * w // len(bar_colors):(i + 1) * w // len(bar_colors)] = color
+
+    def open(self):
+        return True
+
+    def read(self):
+        if self.frame_interval:
+            delay = self.next_frame_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self.next_frame_time = max(self.next_frame_time + self.frame_interval, time.time())
+        w, h = self.size
+        frame = self.background.copy()
+        x = int(w / 2 + w / 3 * np.sin(self.frames / 30))
+        y = int(h / 2 + h / 4 * np.cos(self.frames / 20))
+        cv2.circle(frame, (x, y), 30, (255, 160, 0), -1)
+        cv2.putText(frame, str(self.frames), (10, h - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (128, 128, 128), 2)
+        return frame, None
+
+
+V4L2_SYSFS = '/sys/class/video4linux'
+USB_SYSFS = '/sys/bus/usb/devices'
+# _IOR('V', 0, struct v4l2_capability), the struct is 104 bytes
+VIDIOC_QUERYCAP = 0x80685600
+V4L2_CAP_VIDEO_CAPTURE = 0x00000001
+V4L2_CAP_DEVICE_CAPS = 0x80000000
+# csi sensors show up as v4l-subdev nodes named after the sensor chip
+CSI_SENSOR_PATTERN = re.compile(r'^(imx|ov|ar)\d+', re.IGNORECASE)
+# luxonis / movidius, oak cameras are usb devices without a v4l2 node
+OAK_USB_VENDOR = '03e7'
+
+
+def read_sysfs(path):
+    try:
+        with open(path) as sysfs_file:
+            return sysfs_file.read().strip()
+    except OSError:
+        return ''
+
+
+def v4l2_querycap(device):
+    # -> (driver, card, bus_info, device_caps) of /dev/videoN, None when it can't be opened
+    try:
+        fd = os.open(device, os.O_RDWR | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        buf = bytearray(104)
+        fcntl.ioctl(fd, VIDIOC_QUERYCAP, buf)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+    text = lambda raw: raw.split(b'\0', 1)[0].decode('utf-8', 'replace')
+    capabilities = int.from_bytes(buf[84:88], 'little')
+    device_caps = int.from_bytes(buf[88:92], 'little')
+    return text(buf[0:16]), text(buf[16:48]), text(buf[48:80]), device_caps if capabilities & V4L2_CAP_DEVICE_CAPS else capabilities
+
+
+def probe_signature():
+    # cheap to read, changes when a camera is plugged, unplugged or renumbered
+    nodes = sorted((entry, read_sysfs(os.path.join(V4L2_SYSFS, entry, 'name')),
+                    read_sysfs(os.path.join(V4L2_SYSFS, entry, 'dev')))
+                   for entry in os.listdir(V4L2_SYSFS))
+    oak = sorted(os.path.basename(os.path.dirname(path)) for path in glob.glob(os.path.join(USB_SYSFS, '*', 'idVendor'))
+                 if read_sysfs(path) == OAK_USB_VENDOR)
+    return [list(node) for node in nodes], oak
+
+
+def probe_cameras_uncached(signature):
+    nodes, oak = signature
+    usb = []
+    csi = []
+    for entry, name, dev in nodes:
+        if entry.startswith('v4l-subdev'):
+            if CSI_SENSOR_PATTERN.match(name):
+                csi.append(name)
+            continue
+        if not entry.startswith('video'):
+            continue
+        caps = v4l2_querycap('/dev/' + entry)
+        # uvc cameras also expose a metadata node without the capture cap
+        if caps and caps[0] == 'uvcvideo' and caps[3] & V4L2_CAP_VIDEO_CAPTURE:
+            usb.append({'index': int(entry[5:]), 'card': caps[1], 'bus_info': caps[2]})
+    return {'usb': sorted(usb, key=lambda camera: camera['index']), 'csi': csi, 'oak': oak}
+
+
+def probe_cameras(cache_file=None):
+    """cameras found through sysfs and VIDIOC_QUERYCAP, without running anything.
+    -> {'usb': [{'index', 'card', 'bus_info'}], 'csi': [sensor names], 'oak': [usb ports]}
+    or None where there is no video4linux sysfs to look at.
+    the result is kept in cache_file and reused while the sysfs signature is the
+    same, so a restart with the same cameras does not open any device."""
+    if not os.path.isdir(V4L2_SYSFS):
+        return None
+    signature = probe_signature()
+    if cache_file:
+        try:
+            with open(cache_file) as cache:
+                cached = json.load(cache)
+            if cached['signature'] == [signature[0], signature[1]]:
+                return cached['cameras']
+        except (OSError, ValueError, KeyError):
+            pass
+    cameras = probe_cameras_uncached(signature)
+    if cache_file:
+        try:
+            with open(cache_file, 'w') as cache:
+                json.dump({'signature': [signature[0], signature[1]], 'cameras': cameras}, cache)
+        except OSError as e:
+            print(f"[cv_camera.probe_cameras] cache error: {e}")
+    return cameras
+
+
+def open_camera(source, size, lores_size=None, bitrate=1000000, filename=None, probe_cache=None):
+    # source: auto, v4l2, picamera2, depthai, file or synthetic.
+    # auto opens what probe_cameras found, usb first, then csi, then oak
+    # -> an open CameraSource or None
+    if source == 'auto':
+        try:
+            cameras = probe_cameras(probe_cache)
+        except Exception as e:
+            print(f"[cv_camera.open_camera] probe error: {e}")
+            cameras = None
+        print(f"camera probe: {cameras}")
+        if cameras is None:
+            # no sysfs to probe, try every backend
+            candidates = [V4L2Source(size), Picamera2Source(size, lores_size, bitrate), DepthAISource(size)]
+        else:
+            candidates = [V4L2Source(size, camera['index']) for camera in cameras['usb']]
+            if cameras['csi']:
+                candidates.append(Picamera2Source(size, lores_size, bitrate))
+            if cameras['oak']:
+                candidates.append(DepthAISource(size))
+    elif source == 'v4l2':
+        candidates = [V4L2Source(size)]
+    elif source == 'picamera2':
+        candidates = [Picamera2Source(size, lores_size, bitrate)]
+    elif source == 'depthai':
+        candidates = [DepthAISource(size)]
+    elif source == 'file':
+        candidates = [FileSource(size, filename)]
+    elif source == 'synthetic':
+        candidates = [SyntheticSource(size)]
+    else:
+        raise ValueError(f"unknown camera source: {source}")
+    for candidate in candidates:
+        if candidate.open():
+            return candidate
+    return None
@@ -1,22 +1,24 @@
 import cv2
 import imutils
-import mediapipe as mp
-import imageio
 import threading
 import datetime, time
 import numpy as np
 import math
-import yaml, os, json, subprocess
+import yaml, os, json
 from collections import deque
 import textwrap
-
-# libraries for csi camera
-from picamera2 import Picamera2
-from picamera2.encoders import H264Encoder, Encoder
-from picamera2.outputs import FfmpegOutput
-
-# libraries for oak camera
-import depthai as dai
+from cv_overlay import DisplayList, TextPanel
+from cv_record import VideoRecorder, PhotoWriter
+from cv_worker import CvProcessPool
+from cv_pipeline import CvPipeline
+from cv_profile import FrameProfiler
+from cv_models import ModelRegistry
+from cv_track import ColorTracker, DetectTrack, LandmarkTrack, SortTracker
+from cv_line import LineFollower, Pid, band_rows, measure_bands
+from cv_gimbal import GimbalController
+import cv_camera
+import cv_detect
+from cv_detect import Detections, FrameCache
 
 # config file.
 curpath = os.path.realpath(__file__)
@@ -27,11 +29,16 @@ with open(thisPath + '/config.yaml', 'r') as yaml_file:
 
 class OpencvFuncs():
     """docstring for OpencvFuncs"""
-    def __init__(self, project_path, base_ctrl):
+    def __init__(self, project_path, base_ctrl, camera=True):
         self.base_ctrl = base_ctrl
-        self.cv_event = threading.Event()
-        self.cv_event.clear()
+        self.cv_pipeline = CvPipeline(self.make_prep, self.cv_stage_done, f['cv']['pipeline_workers'], f['cv']['pipeline_budget'])
+        self.frame_seq = 0
+        self.overlay_seq = 0
+        # newest Detections per stage
+        self.detections = {}
         self.cv_mode = f['code']['cv_none']
+        # cv stages running next to cv_mode, name: (rate, priority)
+        self.cv_stages = {}
         self.detection_reaction_mode = f['code']['re_none']
         
         self.this_path = project_path
@@ -39,13 +46,28 @@ class OpencvFuncs():
         self.video_path = self.this_path + '/templates/videos/'
         self.frame_scale = 1
         self.picture_capture_flag = False
+        self.picture_request_time = None
+        self.photo_writer = PhotoWriter(f['video']['photo_writer_threads'])
+        self.burst_count = 0
+        self.burst_frames = []
         self.set_video_record_flag = False
         self.video_record_status_flag = False
-        self.writer = None
-        self.overlay = None
+        self.recorder = VideoRecorder(f['video']['record_queue_size'], f['video']['record_drop_policy'])
+        self.hw_record = False
+        self.overlays = {}
+        self.active_overlays = ()
         self.scale_rate = 1
+        self.zoom_origin = (0, 0)
+        self.sensor_zoom = False
         self.video_quality = f['video']['default_quality']
 
+        # frame loop profiler
+        self.profiler = FrameProfiler(f['video']['profile'])
+        self.profile_hud = f['video']['profile_hud']
+        self.profile_version = 0
+        self.profile_hud_time = time.time()
+        self.profile_panel = TextPanel((5, 305, 270, 475), (0, 0, 0), 0.5)
+
         # cv ctrl info
         self.cv_light_mode = 0
         self.pan_angle = 0
@@ -58,6 +80,10 @@ class OpencvFuncs():
         self.track_spd_rate = f['cv']['track_spd_rate']
         self.track_acc_rate = f['cv']['track_acc_rate']
         self.CMD_GIMBAL = f['cmd_config']['cmd_gimbal_ctrl']
+        self.gimbal = GimbalController(self.gimbal_send, f['cv']['gimbal_cmd_rate'], f['cv']['gimbal_alpha'],
+                                       f['cv']['gimbal_beta'], f['cv']['gimbal_latency'], f['cv']['gimbal_deadband'],
+                                       f['cv']['gimbal_min_step'], self.track_spd_rate, self.track_acc_rate,
+                                       f['cv']['gimbal_timeout'])
         self.sampling_rad = f['cv']['sampling_rad']
 
         # reaction
@@ -68,9 +94,10 @@ class OpencvFuncs():
         self.avg = None
 
         # face detection & tracking
-        self.faceCascade = cv2.CascadeClassifier(thisPath + '/models/haarcascade_frontalface_default.xml')
         self.min_radius = f['cv']['min_radius']
         self.track_faces_iterate = f['cv']['track_faces_iterate']
+        self.face_track = DetectTrack(lambda gray: self.models.call('faces', cv_detect.detect_faces, gray),
+                                      f['cv']['face_detect_interval'], f['cv']['face_tracker'])
 
         # color detection
         self.points = deque(maxlen=32)
@@ -86,20 +113,23 @@ class OpencvFuncs():
             self.color_lower = np.array(f['cv']['color_lower'])
             self.color_upper = np.array(f['cv']['color_upper'])
         self.track_color_iterate = f['cv']['track_color_iterate']
+        self.color_track = ColorTracker([(self.color_lower, self.color_upper)], f['cv']['color_method'], f['cv']['color_window'])
 
         # cv_dnn_objects
-        self.net = cv2.dnn.readNetFromCaffe(thisPath + '/models/deploy.prototxt', thisPath + '/models/mobilenet_iter_73000.caffemodel')
         self.class_names = ["background", "aeroplane", "bicycle", "bird", "boat",
                             "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
                             "dog", "horse", "motorbike", "person", "pottedplant", "sheep",
                             "sofa", "train", "tvmonitor"]
+        self.object_track = SortTracker(f['cv']['object_detect_interval'], f['cv']['object_max_age'],
+                                        f['cv']['object_min_hits'], f['cv']['object_iou'])
 
-        # mediapipe
-        self.mpDraw = mp.solutions.drawing_utils
+        # mediapipe, the graphs run every mp_detect_interval frames and the
+        # landmarks are smoothed and extrapolated in between
+        self.mp_tracks = {name: LandmarkTrack(f['cv']['mp_detect_interval'], f['cv']['mp_min_cutoff'], f['cv']['mp_beta'],
+                                              f['cv']['mp_d_cutoff'], f['cv']['mp_max_extrapolate'])
+                          for name in ('hands', 'mp_faces', 'pose')}
 
         # mediapipe detect hand
-        self.mpHands = mp.solutions.hands
-        self.hands = self.mpHands.Hands(max_num_hands=1)
         self.max_distance = 1
         self.gs_pic_interval = 6
         self.gs_pic_last_time = time.time()
@@ -113,23 +143,66 @@ class OpencvFuncs():
         self.line_track_speed = 0.3
         self.slope_on_speed = 0.1
         self.line_lower = np.array([25, 150, 70])
+        self.line_bands = max(2, f['cv']['line_bands'])
+        self.line_band_height = f['cv']['line_band_height']
+        self.line_curve_impact = f['cv']['line_curve_impact']
+        self.line_pid = Pid(f['cv']['line_kp'], f['cv']['line_ki'], f['cv']['line_kd'], f['cv']['line_kd_filter'])
+        self.line_pid_time = 0
+        self.line_follower = LineFollower(self.line_drive, f['cv']['line_cmd_rate'], f['cv']['line_timeout'],
+                                          f['cv']['line_beta'], f['cv']['line_max_extrapolate'])
         self.line_upper = np.array([42, 255, 255])
 
-        # mediapipe detect faces
-        self.mp_face_detection = mp.solutions.face_detection
-        self.face_detection = self.mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
-
-        # mediapipe detect pose
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(static_image_mode=False, 
-                                    model_complexity=1, 
-                                    smooth_landmarks=True, 
-                                    min_detection_confidence=0.5, 
-                                    min_tracking_confidence=0.5)
+        # models load when their mode first runs, see cv_models
+        cv_detect.set_opencv_threads()
+        self.models = ModelRegistry(project_path, f['cv']['model_idle_unload'])
+
+        # cv execution, 'process' runs the model based modes in worker processes
+        self.cv_process_modes = {
+            f['code']['cv_face']: 'faces',
+            f['code']['cv_objs']: 'objects',
+            f['code']['mp_hand']: 'hands',
+            f['code']['mp_face']: 'mp_faces',
+            f['code']['mp_pose']: 'pose'
+        }
+        self.cv_reactions = {
+            'faces': self.react_faces,
+            'objects': self.react_objects,
+            'hands': self.react_hands,
+            'mp_faces': self.react_mp_faces,
+            'pose': self.react_pose
+        }
+        # processing resolution per cv mode, detectors run on a downscaled view
+        # and their coordinates are mapped back onto the displayed frame
+        self.cv_mode_names = {
+            f['code']['cv_moti']: 'motion',
+            f['code']['cv_face']: 'faces',
+            f['code']['cv_objs']: 'objects',
+            f['code']['cv_clor']: 'color',
+            f['code']['mp_hand']: 'hands',
+            f['code']['cv_auto']: 'line',
+            f['code']['mp_face']: 'mp_faces',
+            f['code']['mp_pose']: 'pose'
+        }
+        self.process_scales = dict(f['cv']['process_scale'])
+        self.cv_stage_funcs = {
+            'motion': self.cv_detect_movition,
+            'faces': self.cv_detect_faces,
+            'objects': self.cv_detect_objects,
+            'color': self.cv_detect_color,
+            'hands': self.mp_detect_hand,
+            'line': self.cv_auto_drive,
+            'mp_faces': self.mediaPipe_faces,
+            'pose': self.mediaPipe_pose
+        }
+        self.cv_pool = None
+        if f['cv']['execution'] == 'process':
+            self.cv_pool = CvProcessPool(self.this_path, f['cv']['process_workers'], self.cv_apply_result)
 
         # base data
         self.show_base_info_flag = False
         self.recv_deque = deque(maxlen=20)
+        self.recv_version = 0
+        self.recv_panel = TextPanel((round(0.05*640), round(0.1*640) - 13, 640, round(0.1*640 + 19 * 13) + 6))
 
         # info update
         self.show_info_flag = True
@@ -139,6 +212,9 @@ class OpencvFuncs():
         self.info_bg_color = (0, 0, 0)
         self.info_show_time = 10
         self.recv_line_max = 26
+        self.info_version = 0
+        self.info_panel = TextPanel((round((self.info_scale-0.005)*640), round((0.33)*480), round(0.98*640), round((0.78)*480)),
+                                    self.info_bg_color, 0.5)
 
         # mission funcs
         self.mission_flag = False
@@ -146,66 +222,31 @@ class OpencvFuncs():
         # osd settings
         self.add_osd = f['base_config']['add_osd']
 
-        # camera type detection
-        self.usb_camera_connected = self.usb_camera_detection()
-        self.csi_camera_connected = False
-        self.oak_camera_connected = False
-
-        # usb camera init
-        if self.usb_camera_connected:
-            self.camera = cv2.VideoCapture(0)
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, f['video']['default_res_w'])
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, f['video']['default_res_h'])
-
-        # csi camera init
-        if not self.usb_camera_connected:
-            print("init csi camera.")
-            try:
-                self.encoder = H264Encoder(1000000)
-                self.picam2 = Picamera2()
-                self.picam2.configure(self.picam2.create_video_configuration(main={"format": 'XRGB8888', "size": (f['video']['default_res_w'], f['video']['default_res_h'])}))
-                self.picam2.start()
-                self.csi_camera_connected = True
-            except:
-                self.csi_camera_connected = False
-
-        #oak camera init 
-        if not self.usb_camera_connected and not self.csi_camera_connected:
-            try:
-                self.pipeline = dai.Pipeline()
-
-                self.camRgb = self.pipeline.createColorCamera()
-                self.camRgb.setBoardSocket(dai.CameraBoardSocket.RGB)
-                self.camRgb.setInterleaved(False)
-                # self.camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_480_P)
-                self.camRgb.setResolution(dai.ColorCameraProperties.SensorResolution.THE_720_P)
-
-                self.xout = self.pipeline.createXLinkOut()
-                self.xout.setStreamName("video")
-                self.camRgb.video.link(self.xout.input)
-
-                self.device = dai.Device(self.pipeline)
-                self.output_queue = self.device.getOutputQueue(name="video", maxSize=8, blocking=False)
-
-                self.oak_camera_connected = True
-            except Exception as e:
-                print(f"[cv_ctrl.frame_process] error: {e}")
-                self.oak_camera_connected = False
+        # camera source, camera=False leaves every camera closed for offline runs
+        self.csi_lores = f['video']['csi_lores']
+        self.lores_size = (f['video']['lores_w'], f['video']['lores_h'])
+        self.camera = None
+        if camera:
+            self.camera = cv_camera.open_camera(f['video']['camera_source'],
+                                                (f['video']['default_res_w'], f['video']['default_res_h']),
+                                                self.lores_size if self.csi_lores else None,
+                                                f['video']['record_bitrate'], f['video']['camera_file'],
+                                                thisPath + '/' + f['video']['camera_probe_cache'] if f['video']['camera_probe_cache'] else None)
+        camera_name = self.camera.name if self.camera is not None else None
+        self.usb_camera_connected = camera_name == 'v4l2'
+        self.csi_camera_connected = camera_name == 'picamera2'
+        self.oak_camera_connected = camera_name == 'depthai'
 
 
     def frame_process(self):
+        lores_frame = None
+        profiler = self.profiler
+        t = profiler.start()
         try:
-            if self.usb_camera_connected:
-                success, input_frame = self.camera.read()
-                if not success:
-                    self.camera.release()
-                    time.sleep(1)
-                    self.camera = cv2.VideoCapture(0)
-            elif self.csi_camera_connected:
-                input_frame = self.picam2.capture_array()
-            elif self.oak_camera_connected:
-                input_frame = self.output_queue.get().getCvFrame()
-                input_frame = cv2.resize(input_frame, (640, 480))
+            if self.camera is not None:
+                input_frame, lores_frame = self.camera.capture()
+                t = profiler.lap('capture', t)
+                input_frame, lores_frame = self.camera.fit(input_frame, lores_frame, self.zoom_crop, self.scale_rate != 1)
             else:
                 input_frame = 255 * np.ones((480, 640, 3), dtype=np.uint8)
                 cv2.putText(input_frame, f"camera read failed... \nusb - csi - oak", 
@@ -224,80 +265,99 @@ class OpencvFuncs():
             ret, buffer = cv2.imencode('.jpg', input_frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.video_quality])
             input_frame = buffer.tobytes()
             return input_frame
+        t = profiler.lap('crop', t)
+        self.frame_seq += 1
+        frame_time = self.camera.timestamp
 
         # opencv funcs
-        if self.cv_mode != f['code']['cv_none']:
-            if not self.cv_event.is_set():
-                self.cv_event.set()
-                self.opencv_threading(input_frame)
+        if self.cv_mode != f['code']['cv_none'] or self.cv_stages:
+            # the workers get their own copy, overlays are drawn on input_frame below
+            if self.cv_pool is not None and self.cv_mode in self.cv_process_modes:
+                mode_name = self.cv_process_modes[self.cv_mode]
+                prep = FrameCache(input_frame, lores_frame, self.lores_size)
+                scale = self.process_scale(mode_name, prep)
+                # the workers convert on their side, only gray input is converted here as it is the smaller copy
+                if cv_detect.DETECTOR_INPUTS[mode_name] == 'gray':
+                    pool_image = prep.gray(scale)
+                else:
+                    pool_image = prep.bgr(scale)
+                self.cv_pool.submit(pool_image, self.frame_seq, frame_time, mode_name, input_frame.shape)
+            if self.cv_pipeline.stages:
+                self.cv_pipeline.submit(input_frame, self.frame_seq, frame_time, lores_frame)
+            t = profiler.lap('cv_handoff', t)
             try:
-                mask = self.overlay.astype(bool)
-                input_frame[mask] = self.overlay[mask]
-                cv2.addWeighted(self.overlay, 1, input_frame, 1, 0, input_frame)
+                for stage_name in self.active_overlays:
+                    overlay = self.overlays.get(stage_name)
+                    if overlay is not None:
+                        overlay.draw(input_frame)
             except Exception as e:
                     print("An error occurred:", e)
+            t = profiler.lap('overlay', t)
         elif self.show_info_flag:
             if time.time() - self.info_update_time > self.info_show_time:
                 self.show_info_flag = False
-            self.overlay = input_frame.copy()
-            cv2.rectangle(self.overlay,  (round((self.info_scale-0.005)*640), round((0.33)*480)), 
-                                    (round(0.98*640), round((0.78)*480)), 
-                                    self.info_bg_color, -1)
-            cv2.addWeighted(self.overlay, 0.5, input_frame, 0.5, 0, input_frame)
-
-            # info_deque.appendleft(time.time())
-            for i in range(0, len(self.info_deque)):
-                cv2.putText(input_frame, str(self.info_deque[i]['text']), 
-                            (round(self.info_scale*640), round(self.info_scale*640 - i * 20)), 
-                            cv2.FONT_HERSHEY_SIMPLEX, self.info_deque[i]['size'], self.info_deque[i]['color'], 1)
+            self.info_panel.render(input_frame, self.info_version, self.info_lines, self.zoom_origin)
+            t = profiler.lap('info_panel', t)
 
         if self.show_base_info_flag:
-            for i in range(0, len(self.recv_deque)):
-                cv2.putText(input_frame, str(self.recv_deque[i]), 
-                        (round(0.05*640), round(0.1*640 + i * 13)), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.369, (255, 255, 255), 1)
+            self.recv_panel.render(input_frame, self.recv_version, self.recv_lines, self.zoom_origin)
+            t = profiler.lap('recv_panel', t)
 
         # render osd
         input_frame = self.osd_render(input_frame)
+        t = profiler.lap('osd', t)
 
         # capture frame
-        if self.picture_capture_flag:
+        if self.picture_capture_flag or self.burst_count:
+            # the record indicator and the profiler hud are still drawn on input_frame
+            photo_frame = input_frame.copy()
             current_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            photo_filename = f'{self.photo_path}photo_{current_time}.jpg'
-            try:
-                cv2.imwrite(photo_filename, input_frame)
+            if self.picture_capture_flag:
                 self.picture_capture_flag = False
-                print(photo_filename)
-            except:
-                pass
-
-        # record video
+                self.photo_writer.write(f'{self.photo_path}photo_{current_time}.jpg', photo_frame, self.picture_request_time)
+            if self.burst_count:
+                self.burst_frames.append(photo_frame)
+                if len(self.burst_frames) >= self.burst_count:
+                    self.photo_writer.write_burst(f'{self.photo_path}burst_{current_time}', self.burst_frames, self.picture_request_time)
+                    self.burst_frames = []
+                    self.burst_count = 0
+            t = profiler.lap('picture', t)
+
+        # record video, the recorder gets input_frame by reference
+        recorded = False
         if not self.set_video_record_flag and not self.video_record_status_flag:
             pass
         elif self.set_video_record_flag and not self.video_record_status_flag:
             current_time = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             video_filename = f'{self.video_path}video_{current_time}.mp4'
-            self.writer = imageio.get_writer(video_filename, fps=30)
+            self.hw_record = f['video']['record_hw_encoder'] and self.camera.start_hw_record(video_filename)
+            if not self.hw_record:
+                self.recorder.start(video_filename, fps=30)
             self.video_record_status_flag = True
         elif self.set_video_record_flag and self.video_record_status_flag:
             cv2.circle(input_frame, (15, 15), 5, (64, 64, 255), -1)
-            self.writer.append_data(np.array(cv2.cvtColor(input_frame, cv2.COLOR_BGRA2RGB)))
+            if not self.hw_record:
+                recorded = self.recorder.submit(input_frame)
         elif not self.set_video_record_flag and self.video_record_status_flag:
             self.video_record_status_flag = False
-            self.writer.close()
-
-        # frame scale
-        if self.scale_rate == 1:
-            pass
-        else:
-            img_height, img_width = input_frame.shape[:2]
-            img_width_d2  = img_width/2
-            img_height_d2 = img_height/2
-            x_start = int(img_width_d2 - (img_width_d2//self.scale_rate))
-            x_end   = int(img_width_d2 + (img_width_d2//self.scale_rate))
-            y_start = int(img_height_d2 - (img_height_d2//self.scale_rate))
-            y_end   = int(img_height_d2 + (img_height_d2//self.scale_rate))
-            input_frame = input_frame[y_start:y_end, x_start:x_end]
+            if self.hw_record:
+                self.camera.stop_hw_record()
+                self.hw_record = False
+            else:
+                self.recorder.stop()
+        t = profiler.lap('record', t)
+
+        # profiler hud, refreshed once a second
+        if self.profile_hud and profiler.enabled:
+            if time.time() - self.profile_hud_time >= 1:
+                self.profile_version += 1
+                self.profile_hud_time = time.time()
+            if recorded:
+                # keep the hud out of the recording
+                input_frame = input_frame.copy()
+            self.profile_panel.render(input_frame, self.profile_version,
+                                      lambda: profiler.hud_lines((10, 320)), self.zoom_origin)
+            t = profiler.lap('hud', t)
 
         # encode frame
         try:
@@ -305,6 +365,7 @@ class OpencvFuncs():
             input_frame = buffer.tobytes()
         except:
             pass
+        profiler.lap('encode', t)
 
         # get fps
         self.fps_count += 1
@@ -318,15 +379,15 @@ class OpencvFuncs():
 
 
 
-    def usb_camera_detection(self):
-        lsusb_output = subprocess.check_output(["lsusb"]).decode("utf-8")
-        if "Camera" in lsusb_output:
-            print("USB Camera connected")
-            return True
-        else:
-            print("USB Camera not connected")
-            return False
+    def info_lines(self):
+        info_items = list(self.info_deque)
+        return [(item['text'], (round(self.info_scale*640), round(self.info_scale*640 - i * 20)), item['size'], item['color'])
+                for i, item in enumerate(info_items)]
 
+    def recv_lines(self):
+        recv_items = list(self.recv_deque)
+        return [(item, (round(0.05*640), round(0.1*640 + i * 13)), 0.369, (255, 255, 255))
+                for i, item in enumerate(recv_items)]
 
     def osd_render(self, osd_frame):
         if not self.add_osd:
@@ -336,10 +397,11 @@ class OpencvFuncs():
         # cv2.putText(overlay_buffer, 'OSD_TEST', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
 
         # render lidar data
+        osd_h, osd_w = osd_frame.shape[:2]
         lidar_points = []
         for lidar_angle, lidar_distance in zip(self.base_ctrl.rl.lidar_angles_show, self.base_ctrl.rl.lidar_distances_show):
-            lidar_x = int(lidar_distance * np.cos(lidar_angle) * 0.05) + 320
-            lidar_y = int(lidar_distance * np.sin(lidar_angle) * 0.05) + 240
+            lidar_x = int(lidar_distance * np.cos(lidar_angle) * 0.05) + osd_w // 2
+            lidar_y = int(lidar_distance * np.sin(lidar_angle) * 0.05) + osd_h // 2
             lidar_points.append((lidar_x, lidar_y))
 
         for lidar_point in lidar_points:
@@ -358,8 +420,17 @@ class OpencvFuncs():
         return osd_frame
 
     def picture_capture(self):
+        self.picture_request_time = time.time()
         self.picture_capture_flag = True
 
+    def picture_burst(self, input_count):
+        # grab n consecutive frames into memory, they are written out once all are taken
+        if self.burst_count or input_count < 1:
+            return
+        self.picture_request_time = time.time()
+        self.burst_frames = []
+        self.burst_count = min(int(input_count), f['video']['burst_max_frames'])
+
     def video_record(self, input_cmd):
         if input_cmd:
             self.set_video_record_flag = True
@@ -371,6 +442,29 @@ class OpencvFuncs():
             self.scale_rate = 1
         else:
             self.scale_rate = input_rate
+        # cv state built on the previous field of view is no longer valid
+        self.avg = None
+        self.points.clear()
+        self.overlays.clear()
+        if self.camera is not None:
+            self.sensor_zoom = self.camera.set_zoom(self.scale_rate)
+        if self.scale_rate == 1 or self.sensor_zoom:
+            self.zoom_origin = (0, 0)
+
+    def zoom_crop(self, input_frame, set_origin=True):
+        # zoom as an early numpy view, everything after this works on the roi only
+        if self.scale_rate == 1:
+            return input_frame
+        img_height, img_width = input_frame.shape[:2]
+        img_width_d2  = img_width/2
+        img_height_d2 = img_height/2
+        x_start = int(img_width_d2 - (img_width_d2//self.scale_rate))
+        x_end   = int(img_width_d2 + (img_width_d2//self.scale_rate))
+        y_start = int(img_height_d2 - (img_height_d2//self.scale_rate))
+        y_end   = int(img_height_d2 + (img_height_d2//self.scale_rate))
+        if set_origin:
+            self.zoom_origin = (x_start, y_start)
+        return input_frame[y_start:y_end, x_start:x_end]
 
     def set_video_quality(self, input_quality):
         if input_quality < 1:
@@ -382,9 +476,63 @@ class OpencvFuncs():
 
     def set_cv_mode(self, input_mode):
         self.cv_mode = input_mode
+        self.update_cv_stages()
         if self.cv_mode == f['code']['cv_none']:
             self.set_video_record_flag = False
 
+    def add_cv_stage(self, stage_name, rate=None, priority=None):
+        # run another cv mode next to cv_mode, rate and priority default to cv.stages
+        if stage_name not in self.cv_stage_funcs:
+            return False
+        stage_config = f['cv']['stages'][stage_name]
+        self.cv_stages[stage_name] = (rate or stage_config['rate'], stage_config['priority'] if priority is None else priority)
+        self.update_cv_stages()
+        return True
+
+    def remove_cv_stage(self, stage_name):
+        self.cv_stages.pop(stage_name, None)
+        self.update_cv_stages()
+
+    def update_cv_stages(self):
+        # cv_mode runs in the pipeline with the extra stages,
+        # unless it is one of the modes handled by the process pool
+        stages = dict(self.cv_stages)
+        active = set(stages)
+        mode_name = self.cv_mode_names.get(self.cv_mode)
+        if mode_name is not None:
+            active.add(mode_name)
+            if mode_name not in stages and not (self.cv_pool is not None and self.cv_mode in self.cv_process_modes):
+                # the selected mode runs on every frame, cv.stages rates are for the extra stages
+                stages[mode_name] = (None, f['cv']['stages'][mode_name]['priority'])
+        for stage_name in self.cv_pipeline.names():
+            if stage_name not in stages:
+                self.cv_pipeline.remove_stage(stage_name)
+        for stage_name, (rate, priority) in stages.items():
+            self.cv_pipeline.set_stage(stage_name, self.cv_stage_funcs[stage_name], rate, priority)
+        # a stage still running when it was removed may put its overlay back, only active ones are drawn
+        self.active_overlays = tuple(active)
+        for stage_name in list(self.overlays):
+            if stage_name not in active:
+                self.overlays.pop(stage_name, None)
+        for stage_name in list(self.detections):
+            if stage_name not in active:
+                self.detections.pop(stage_name, None)
+
+    def set_process_scale(self, mode_name, scale):
+        if mode_name not in self.process_scales:
+            return False
+        self.process_scales[mode_name] = min(max(float(scale), 0.1), 1.0)
+        # the motion background is kept at processing resolution
+        self.avg = None
+        return True
+
+    def process_scale(self, mode_name, prep, color=False):
+        # -> the FrameCache scale the detector of mode_name runs at. motion, face and line
+        # detection take the lores stream when there is one, it is already small
+        if mode_name in ('motion', 'faces', 'line') and prep.has_lores(color):
+            return 'lores'
+        return self.process_scales.get(mode_name, 1)
+
     def set_detection_reaction(self, input_reaction):
         self.detection_reaction_mode = input_reaction
         if self.detection_reaction_mode == f['code']['re_none']:
@@ -392,12 +540,14 @@ class OpencvFuncs():
 
 
 
-    def cv_detect_movition(self, img):
+    def cv_detect_movition(self, prep):
+        img = prep.image
         timestamp = datetime.datetime.now()
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
+        scale = self.process_scale('motion', prep)
+        factor = prep.factor(scale)
+        gray = prep.gray(scale, 21)
 
-        if self.avg is None:
+        if self.avg is None or self.avg.shape != gray.shape:
             self.avg = gray.copy().astype("float")
             return
         try:
@@ -413,15 +563,17 @@ class OpencvFuncs():
         cnts = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cnts = imutils.grab_contours(cnts)
         # loop over the contours
-        overlay_buffer = np.zeros_like(img)
+        overlay_buffer = DisplayList()
+        motion_boxes = []
         for c in cnts:
             # if the contour is too small, ignore it
-            if cv2.contourArea(c) < 2000:
+            if cv2.contourArea(c) < 2000 / factor ** 2:
                 continue
             # compute the bounding box for the contour, draw it on the frame,
             # and update the text
-            (mov_x, mov_y, mov_w, mov_h) = cv2.boundingRect(c)
-            cv2.rectangle(overlay_buffer, (mov_x, mov_y), (mov_x + mov_w, mov_y + mov_h), (128, 255, 0), 1)
+            (mov_x, mov_y, mov_w, mov_h) = (int(v * factor) for v in cv2.boundingRect(c))
+            overlay_buffer.rectangle((mov_x, mov_y), (mov_x + mov_w, mov_y + mov_h), (128, 255, 0), 1)
+            motion_boxes.append((mov_x, mov_y, mov_x + mov_w, mov_y + mov_h))
             self.last_movtion_captured = timestamp
 
             if(timestamp - self.last_frame_capture_time).seconds >= 1:
@@ -438,41 +590,30 @@ class OpencvFuncs():
                 if(timestamp - self.last_frame_capture_time).seconds >= 5:
                     self.video_record(False)
 
-        self.overlay = overlay_buffer
-
-    def gimbal_track(self, fx, fy, gx, gy, iterate):
-        global gimbal_x, gimbal_y
-        distance = math.sqrt((fx - gx) ** 2 + (gy - fy) ** 2)
-        self.pan_angle += (gx - fx) * iterate
-        self.tilt_angle += (fy - gy) * iterate
-        if self.pan_angle > 180:
-            self.pan_angle = 180
-        elif self.pan_angle < -180:
-            self.pan_angle = -180
-        if self.tilt_angle > 90:
-            self.tilt_angle = 90
-        elif self.tilt_angle < -30:
-            self.tilt_angle = -30
-        gimbal_spd = int(distance * self.track_spd_rate)
-        gimbal_acc = int(distance * self.track_acc_rate)
-        if gimbal_acc < 1:
-            gimbal_acc = 1
-        if gimbal_spd < 1:
-            gimbal_spd = 1
-        self.base_ctrl.base_json_ctrl({"T":self.CMD_GIMBAL,"X":self.pan_angle,"Y":self.tilt_angle,"SPD":gimbal_spd,"ACC":gimbal_acc})
-        return distance
-
-    def cv_detect_faces(self, img):
-        gray_img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = self.faceCascade.detectMultiScale(
-                gray_img,     
-                scaleFactor=1.2,
-                minNeighbors=5,     
-                minSize=(20, 20)
-            )
-        overlay_buffer = np.zeros_like(img)
+        self.overlays['motion'] = overlay_buffer
+        return Detections('motion', (img.shape[1], img.shape[0]), motion_boxes)
 
-        height, width = img.shape[:2]
+    def gimbal_track(self, fx, fy, gx, gy, iterate, timestamp=None):
+        # the gimbal thread sends at its own rate, see cv_gimbal. timestamp is
+        # when the frame was taken, for the pose the gimbal had at that time
+        return self.gimbal.observe(gx - fx, fy - gy, iterate, timestamp)
+
+    def gimbal_send(self, pan, tilt, spd, acc):
+        self.pan_angle = pan
+        self.tilt_angle = tilt
+        self.base_ctrl.base_json_ctrl({"T":self.CMD_GIMBAL,"X":pan,"Y":tilt,"SPD":spd,"ACC":acc})
+
+    def cv_detect_faces(self, prep):
+        scale = self.process_scale('faces', prep)
+        # haar only every face_detect_interval frames, tracked in between
+        faces, _ = self.face_track.update(prep.gray(scale))
+        faces = np.round(faces).astype(np.int32)
+        return self.react_faces(cv_detect.scale_result('faces', faces, prep.factor(scale)), prep.image.shape, prep.timestamp)
+
+    def react_faces(self, faces, frame_shape, timestamp=None):
+        overlay_buffer = DisplayList()
+
+        height, width = frame_shape[:2]
         center_x, center_y = width // 2, height // 2
 
         max_area = 0
@@ -485,14 +626,14 @@ class OpencvFuncs():
                     self.base_ctrl.lights_ctrl(self.base_ctrl.base_light_status, self.base_ctrl.head_light_status)
 
             for (x,y,w,h) in faces:
-                cv2.rectangle(overlay_buffer,(x,y),(x+w,y+h),(64,128,255),1)
+                overlay_buffer.rectangle((x,y),(x+w,y+h),(64,128,255),1)
                 face_area = w * h
                 if face_area > max_area:
                     max_area = face_area
                     max_face_center = (x + w // 2, y + h // 2)
 
             if not self.cv_movtion_lock:
-                self.gimbal_track(center_x, center_y, max_face_center[0], max_face_center[1], self.track_faces_iterate)
+                self.gimbal_track(center_x, center_y, max_face_center[0], max_face_center[1], self.track_faces_iterate, timestamp)
 
             if(datetime.datetime.now() - self.last_frame_capture_time).seconds >= 3:
                 if self.detection_reaction_mode == f['code']['re_none']:
@@ -512,112 +653,113 @@ class OpencvFuncs():
                 if(datetime.datetime.now() - self.last_frame_capture_time).seconds >= 5:
                     self.video_record(False)
 
-        cv2.putText(overlay_buffer, 'NUMBER: {}'.format(len(faces)), (center_x+50, center_y+40), 
-                                                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, 'ITERATE: {}'.format(self.track_faces_iterate), (center_x+50, center_y+60), 
-                                                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+80), 
-                                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+100), 
-                                                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        self.overlay = overlay_buffer
-
-    def cv_detect_objects(self, img):
-        overlay_buffer = np.zeros_like(img)
-        cv2.putText(overlay_buffer, 'CV_OBJS', (50, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-        (h, w) = img.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(img, (300, 300)), 0.007843, (300, 300), 127.5)
-        self.net.setInput(blob)
-        detections = self.net.forward()
-
-        for i in range(0, detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-
-            if confidence > 0.2:
-                idx = int(detections[0, 0, i, 1])
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (startX, startY, endX, endY) = box.astype("int")
-
-                label = "{}: {:.2f}%".format(self.class_names[idx], confidence * 100)
-                cv2.rectangle(overlay_buffer, (startX, startY), (endX, endY), (0, 255, 0), 2)
-                y = startY - 15 if startY - 15 > 15 else startY + 15
-                cv2.putText(overlay_buffer, label, (startX, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-
-        self.overlay = overlay_buffer
-
-    def cv_detect_color(self, img):
+        overlay_buffer.text('NUMBER: {}'.format(len(faces)), (center_x+50, center_y+40), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text('ITERATE: {}'.format(self.track_faces_iterate), (center_x+50, center_y+60), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+80), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+100), 0.5, (255, 255, 255), 1)
+        self.overlays['faces'] = overlay_buffer
+        face_boxes = np.asarray(faces, dtype=np.float32).reshape(-1, 4)
+        face_boxes[:, 2:] += face_boxes[:, :2]
+        return Detections('faces', (width, height), face_boxes)
+
+    def cv_detect_objects(self, prep):
+        # the ssd only runs every object_detect_interval frames, the tracks are predicted in between
+        if not self.object_track.inference_due():
+            return self.react_objects(None, prep.image.shape, prep.timestamp)
+        scale = self.process_scale('objects', prep)
+        objects = self.models.call('objects', cv_detect.detect_objects, prep.rgb(scale))
+        return self.react_objects(cv_detect.scale_result('objects', objects, prep.factor(scale)), prep.image.shape, prep.timestamp)
+
+    def react_objects(self, objects, frame_shape, timestamp=None):
+        # objects None: no inference on this frame
+        if objects is None:
+            tracks = self.object_track.predict((frame_shape[1], frame_shape[0]))
+        else:
+            tracks = self.object_track.update(objects, timestamp)
+        overlay_buffer = DisplayList()
+        overlay_buffer.text('CV_OBJS', (50, 50), 1, (255, 255, 255), 2)
+
+        for track_id, class_id, confidence, startX, startY, endX, endY in tracks:
+            label = "{} #{}: {:.2f}%".format(self.class_names[int(class_id)], int(track_id), confidence * 100)
+            overlay_buffer.rectangle((startX, startY), (endX, endY), (0, 255, 0), 2)
+            y = startY - 15 if startY - 15 > 15 else startY + 15
+            overlay_buffer.text(label, (startX, y), 0.5, (0, 255, 0), 2)
+
+        self.overlays['objects'] = overlay_buffer
+        return Detections('objects', (frame_shape[1], frame_shape[0]), tracks[:, 3:7], tracks[:, 2],
+                          [self.class_names[int(class_id)] for class_id in tracks[:, 1]],
+                          extra={'ids': tracks[:, 0].astype(int).tolist()})
+
+    def cv_detect_color(self, prep):
         global head_light_pwm
-        blurred = cv2.GaussianBlur(img, (11, 11), 0)
-        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-
-        mask = cv2.inRange(hsv, self.color_lower, self.color_upper)
-        mask = cv2.erode(mask, None, iterations=5)
-        mask = cv2.dilate(mask, None, iterations=5)
+        img = prep.image
+        scale = self.process_scale('color', prep, color=True)
+        factor = prep.factor(scale)
+        bgr = prep.bgr(scale)
 
-        cnts = cv2.findContours(mask.copy(), cv2.RETR_EXTERNAL,
-            cv2.CHAIN_APPROX_SIMPLE)
-        cnts = imutils.grab_contours(cnts)
+        # lut threshold in a window around the last find, see cv_track.ColorTracker
+        found = self.color_track.update(bgr)
         center = None
+        color_detections = Detections('color', (img.shape[1], img.shape[0]))
 
-        overlay_buffer = np.zeros_like(img)
+        overlay_buffer = DisplayList()
 
         height, width = img.shape[:2]
         center_x, center_y = width // 2, height // 2
 
-        mask = np.zeros((height, width), dtype=np.uint8)
-        cv2.circle(mask, (center_x, center_y), self.sampling_rad, (255), thickness=-1)
+        # hsv of the sampling circle only, for picking a new target color
+        view_h, view_w = bgr.shape[:2]
+        rad = max(1, int(self.sampling_rad / factor))
+        x0, y0 = max(0, view_w // 2 - rad), max(0, view_h // 2 - rad)
+        sample = cv2.cvtColor(cv2.GaussianBlur(bgr[y0:view_h // 2 + rad + 1, x0:view_w // 2 + rad + 1], (11, 11), 0), cv2.COLOR_BGR2HSV)
+        mask = np.zeros(sample.shape[:2], dtype=np.uint8)
+        cv2.circle(mask, (view_w // 2 - x0, view_h // 2 - y0), rad, (255), thickness=-1)
 
-        masked_hsv = cv2.bitwise_and(hsv, hsv, mask=mask)
-        masked_hsv_pixels = masked_hsv[mask == 255]
+        masked_hsv_pixels = sample[mask == 255]
         lower_hsv = np.min(masked_hsv_pixels, axis=0)
         upper_hsv = np.max(masked_hsv_pixels, axis=0)
 
-        cv2.putText(overlay_buffer, ' UPPER: {}'.format(upper_hsv), (center_x+50, center_y+40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' LOWER: {}'.format(lower_hsv), (center_x+50, center_y+60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' UPPER: {}'.format(upper_hsv), (center_x+50, center_y+40), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' LOWER: {}'.format(lower_hsv), (center_x+50, center_y+60), 0.5, (255, 255, 255), 1)
 
-        cv2.putText(overlay_buffer, ' UPPER: {}'.format(self.color_upper), (center_x+50, center_y+100), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, ' LOWER: {}'.format(self.color_lower), (center_x+50, center_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, 'ITERATE: {}'.format(self.track_color_iterate), (center_x+50, center_y+140), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+180), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' UPPER: {}'.format(self.color_upper), (center_x+50, center_y+100), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(' LOWER: {}'.format(self.color_lower), (center_x+50, center_y+120), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text('ITERATE: {}'.format(self.track_color_iterate), (center_x+50, center_y+140), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+160), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+180), 0.5, (255, 255, 255), 1)
         
-        cv2.circle(overlay_buffer, (center_x, center_y), self.sampling_rad, (64, 255, 64), 1)
-
-        # only proceed if at least one contour was found
-        if len(cnts) > 0:
-            # find the largest contour in the mask, then use
-            # it to compute the minimum enclosing circle and
-            # centroid
-            c = max(cnts, key=cv2.contourArea)
-            ((x, y), radius) = cv2.minEnclosingCircle(c)
-            M = cv2.moments(c)
-            center = (int(M["m10"] / M["m00"]), int(M["m01"] / M["m00"]))
+        overlay_buffer.circle((center_x, center_y), self.sampling_rad, (64, 255, 64), 1)
+
+        # only proceed if the color was found
+        if found is not None:
+            # the minimum enclosing circle and centroid of the largest blob
+            (x, y), radius, (m_x, m_y) = found
+            x, y, radius = x * factor, y * factor, radius * factor
+            center = (int(m_x * factor), int(m_y * factor))
 
             # only proceed if the radius meets a minimum size
             if radius > self.min_radius:
                 if not self.cv_movtion_lock:
-                    distance = self.gimbal_track(center_x, center_y, center[0], center[1], self.track_color_iterate)
+                    distance = self.gimbal_track(center_x, center_y, center[0], center[1], self.track_color_iterate, prep.timestamp)
                     if distance < self.aimed_error:
                         head_light_pwm = 10
                         self.base_ctrl.lights_ctrl(self.base_ctrl.base_light_status, head_light_pwm)
                     else:
                         head_light_pwm = 0
                         self.base_ctrl.lights_ctrl(self.base_ctrl.base_light_status, head_light_pwm)
-                    cv2.putText(overlay_buffer, 'DIF: {}'.format(distance), (center_x+50, center_y+20), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                    overlay_buffer.text('DIF: {}'.format(distance), (center_x+50, center_y+20), 0.5, (255, 255, 255), 1)
 
                 # draw the circle and centroid on the frame,
                 # then update the list of tracked points
-                cv2.circle(overlay_buffer, (int(x), int(y)), int(radius),
+                overlay_buffer.circle((int(x), int(y)), int(radius),
                     (128, 255, 255), 1)
-                cv2.circle(overlay_buffer, center, 3, (128, 255, 255), -1)
-                cv2.line(overlay_buffer, center, (center_x, center_y), (0, 0, 255), 1)
-                cv2.putText(overlay_buffer, 'RAD: {}'.format(radius), (center_x+50, center_y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                overlay_buffer.circle(center, 3, (128, 255, 255), -1)
+                overlay_buffer.line(center, (center_x, center_y), (0, 0, 255), 1)
+                overlay_buffer.text('RAD: {}'.format(radius), (center_x+50, center_y), 0.5, (255, 255, 255), 1)
 
                 self.points.appendleft(center)
+                color_detections = Detections('color', (width, height), [(x - radius, y - radius, x + radius, y + radius)],
+                                              landmarks=[[center]], extra={'radius': round(radius, 1)})
             else:
                 head_light_pwm = 0
                 self.base_ctrl.lights_ctrl(self.base_ctrl.base_light_status, head_light_pwm)
@@ -626,17 +768,21 @@ class OpencvFuncs():
             for i in range(1, len(self.points)):
                 if self.points[i-1] is None or self.points[i] is None:
                     continue
-                cv2.line(overlay_buffer, self.points[i - 1], self.points[i], (255, 255, 128), 1)
+                overlay_buffer.line(self.points[i - 1], self.points[i], (255, 255, 128), 1)
+
+        self.overlays['color'] = overlay_buffer
+        return color_detections
 
-        self.overlay = np.zeros_like(img)
-        self.overlay = overlay_buffer
+    def line_drive(self, speed, turning):
+        if not self.cv_movtion_lock:
+            self.base_ctrl.base_json_ctrl({"T":13,"X":speed,"Z":turning})
 
     def calculate_distance(self, lm1, lm2):
-        return ((lm1.x - lm2.x) ** 2 + (lm1.y - lm2.y) ** 2) ** 0.5
+        return ((lm1[0] - lm2[0]) ** 2 + (lm1[1] - lm2[1]) ** 2) ** 0.5
 
     def calculate_angle(self, A1, A2, B1, B2):
-        vector_A = (A2.x - A1.x, A2.y - A1.y)
-        vector_B = (B2.x - B1.x, B2.y - B1.y)
+        vector_A = (A2[0] - A1[0], A2[1] - A1[1])
+        vector_B = (B2[0] - B1[0], B2[1] - B1[1])
 
         dot_product = vector_A[0] * vector_B[0] + vector_A[1] * vector_B[1]
 
@@ -654,57 +800,64 @@ class OpencvFuncs():
             return 0
         return (value - original_min) / (original_max - original_min) * (new_max - new_min) + new_min
 
-    def mp_detect_hand(self, img):
-        height, width = img.shape[:2]
-        center_x, center_y = width // 2, height // 2
+    def mp_detect_hand(self, prep):
+        if not self.mp_tracks['hands'].inference_due():
+            return self.react_hands(None, prep.image.shape, prep.timestamp)
+        hands = self.models.call('hands', cv_detect.detect_hands, prep.rgb(self.process_scale('hands', prep)))
+        return self.react_hands(hands, prep.image.shape, prep.timestamp)
 
-        imgRGB = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(imgRGB)
+    def react_hands(self, hands, frame_shape, timestamp=None):
+        # hands None: no inference on this frame
+        if hands is None:
+            hands = self.mp_tracks['hands'].predict(timestamp)
+        else:
+            hands = self.mp_tracks['hands'].update(hands, timestamp)
+        height, width = frame_shape[:2]
+        center_x, center_y = width // 2, height // 2
 
-        overlay_buffer = np.zeros_like(imgRGB)
+        overlay_buffer = DisplayList()
         get_pwm = 0
 
-        if results.multi_hand_landmarks:
-            for handLms in results.multi_hand_landmarks:
+        if len(hands):
+            mp_hands = cv_detect.mp_solution('hands')
+            for hand_lms in hands:
                 # draw joints
-                for id, lm in enumerate(handLms.landmark):
-                    h, w, c = imgRGB.shape
-                    cx, cy = int(lm.x * w), int(lm.y * h)
-                    cv2.circle(overlay_buffer, (cx, cy), 5, (255, 0, 0), -1)
+                hand_points = hand_lms[:, :2] * (width, height)
+                for cx, cy in hand_points:
+                    overlay_buffer.circle((cx, cy), 5, (255, 0, 0), -1)
 
                 # draw lines
-                self.mpDraw.draw_landmarks(overlay_buffer, handLms, self.mpHands.HAND_CONNECTIONS)
+                overlay_buffer.landmarks(hand_points, mp_hands.HAND_CONNECTIONS)
 
-                target_pos = handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_TIP]
-                # print(f"x:{target_pos.x} y:{target_pos.y}")
+                target_pos = hand_lms[mp_hands.HandLandmark.INDEX_FINGER_TIP]
+                # print(f"x:{target_pos[0]} y:{target_pos[1]}")
                 if not self.cv_movtion_lock:
-                    distance = self.gimbal_track(center_x, center_y, width*target_pos.x, height*target_pos.y, self.track_faces_iterate)
+                    distance = self.gimbal_track(center_x, center_y, width*target_pos[0], height*target_pos[1], self.track_faces_iterate, timestamp)
 
                 # check hand gs
                 pinky_finger_gs = self.calculate_angle(
-                                            handLms.landmark[self.mpHands.HandLandmark.WRIST],
-                                            handLms.landmark[self.mpHands.HandLandmark.PINKY_MCP],
-                                            handLms.landmark[self.mpHands.HandLandmark.PINKY_MCP],
-                                            handLms.landmark[self.mpHands.HandLandmark.PINKY_TIP])
+                                            hand_lms[mp_hands.HandLandmark.WRIST],
+                                            hand_lms[mp_hands.HandLandmark.PINKY_MCP],
+                                            hand_lms[mp_hands.HandLandmark.PINKY_MCP],
+                                            hand_lms[mp_hands.HandLandmark.PINKY_TIP])
 
                 index_finger_gs = self.calculate_angle(
-                                            handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_MCP],
-                                            handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_PIP],
-                                            handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_PIP],
-                                            handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_TIP])
+                                            hand_lms[mp_hands.HandLandmark.INDEX_FINGER_MCP],
+                                            hand_lms[mp_hands.HandLandmark.INDEX_FINGER_PIP],
+                                            hand_lms[mp_hands.HandLandmark.INDEX_FINGER_PIP],
+                                            hand_lms[mp_hands.HandLandmark.INDEX_FINGER_TIP])
 
                 middle_finger_gs = self.calculate_angle(
-                                            handLms.landmark[self.mpHands.HandLandmark.MIDDLE_FINGER_MCP],
-                                            handLms.landmark[self.mpHands.HandLandmark.MIDDLE_FINGER_PIP],
-                                            handLms.landmark[self.mpHands.HandLandmark.MIDDLE_FINGER_PIP],
-                                            handLms.landmark[self.mpHands.HandLandmark.MIDDLE_FINGER_TIP])
+                                            hand_lms[mp_hands.HandLandmark.MIDDLE_FINGER_MCP],
+                                            hand_lms[mp_hands.HandLandmark.MIDDLE_FINGER_PIP],
+                                            hand_lms[mp_hands.HandLandmark.MIDDLE_FINGER_PIP],
+                                            hand_lms[mp_hands.HandLandmark.MIDDLE_FINGER_TIP])
 
                 # LED Ctrl
                 if middle_finger_gs > 20 and pinky_finger_gs > 90:
-                    cv2.putText(overlay_buffer, ' GS: LED Ctrl', (center_x+50, center_y+100), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-                    tips_distance = self.calculate_distance(handLms.landmark[self.mpHands.HandLandmark.INDEX_FINGER_TIP],
-                        handLms.landmark[self.mpHands.HandLandmark.THUMB_TIP])
+                    overlay_buffer.text(' GS: LED Ctrl', (center_x+50, center_y+100), 0.5, (255, 128, 128), 1)
+                    tips_distance = self.calculate_distance(hand_lms[mp_hands.HandLandmark.INDEX_FINGER_TIP],
+                        hand_lms[mp_hands.HandLandmark.THUMB_TIP])
 
                     if index_finger_gs < 3:
                         self.max_distance = tips_distance
@@ -720,162 +873,175 @@ class OpencvFuncs():
 
                 # Take Pic
                 elif middle_finger_gs < 10 and pinky_finger_gs > 90 and index_finger_gs < 10:
-                    cv2.putText(overlay_buffer, ' GS: Take Pic', (center_x+50, center_y+100), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
+                    overlay_buffer.text(' GS: Take Pic', (center_x+50, center_y+100), 0.5, (255, 128, 128), 1)
                     if time.time() - self.gs_pic_last_time > self.gs_pic_interval:
                         self.base_ctrl.lights_ctrl(255, 255)
-                        time.sleep(0.01)
                         self.picture_capture()
-                        self.base_ctrl.lights_ctrl(0, 0)
+                        # lights off from a timer, not by sleeping in the cv thread
+                        threading.Timer(0.01, self.base_ctrl.lights_ctrl, (0, 0)).start()
                         self.gs_pic_last_time = time.time()
 
                 # Not Found
                 else:
-                    cv2.putText(overlay_buffer, ' GS: Not Defined', (center_x+50, center_y+100), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
+                    overlay_buffer.text(' GS: Not Defined', (center_x+50, center_y+100), 0.5, (255, 128, 128), 1)
                     self.base_ctrl.lights_ctrl(0, 0)
 
-        cv2.putText(overlay_buffer, 'ITERATE: {}'.format(self.track_faces_iterate), (center_x+50, center_y+140), 
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+160), 
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+180), 
-            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        overlay_buffer.text('ITERATE: {}'.format(self.track_faces_iterate), (center_x+50, center_y+140), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' SPD_R: {}'.format(self.track_spd_rate), (center_x+50, center_y+160), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' ACC_R: {}'.format(self.track_acc_rate), (center_x+50, center_y+180), 0.5, (255, 255, 255), 1)
 
-        self.overlay = overlay_buffer
+        self.overlays['hands'] = overlay_buffer
+        return Detections('hands', (width, height), landmarks=hands * (width, height, 1))
 
-    def cv_auto_drive(self, img):
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    def cv_auto_drive(self, prep):
+        img = prep.image
+        scale = self.process_scale('line', prep, color=True)
+        factor = prep.factor(scale)
+        bgr = prep.bgr(scale)
 
-        # get a sampling
+        # get a sampling, hsv of the small circle at the center only
         height, width = img.shape[:2]
         center_x, center_y = width // 2, height // 2
-        mask_sampling = np.zeros((height, width), dtype=np.uint8)
-        cv2.circle(mask_sampling, (center_x, center_y), int(self.sampling_rad/4), (255), thickness=-1)
-        masked_hsv = cv2.bitwise_and(hsv, hsv, mask=mask_sampling)
-        masked_hsv_pixels = masked_hsv[mask_sampling == 255]
+        view_h, view_w = bgr.shape[:2]
+        rad = max(1, int(self.sampling_rad / 4 / factor))
+        x0, y0 = max(0, view_w // 2 - rad), max(0, view_h // 2 - rad)
+        sample = cv2.cvtColor(bgr[y0:view_h // 2 + rad + 1, x0:view_w // 2 + rad + 1], cv2.COLOR_BGR2HSV)
+        mask_sampling = np.zeros(sample.shape[:2], dtype=np.uint8)
+        cv2.circle(mask_sampling, (view_w // 2 - x0, view_h // 2 - y0), rad, (255), thickness=-1)
+        masked_hsv_pixels = sample[mask_sampling == 255]
         lower_hsv = np.min(masked_hsv_pixels, axis=0)
         upper_hsv = np.max(masked_hsv_pixels, axis=0)
 
-        # select the line color & get the mask
-        # img = cv2.GaussianBlur(img, (11, 11), 0)
-        line_mask = cv2.inRange(hsv, self.line_lower, self.line_upper)
-        line_mask = cv2.erode(line_mask, None, iterations=2)
-        line_mask = cv2.dilate(line_mask, None, iterations=2)
+        # threshold the line color in narrow bands from sampling_line_1 to sampling_line_2 only
+        bands = measure_bands(bgr, band_rows(self.line_bands, self.sampling_line_1, self.sampling_line_2),
+                              self.line_lower, self.line_upper, self.line_band_height)
 
         sampling_h1 = int(height * self.sampling_line_1)
         sampling_h2 = int(height * self.sampling_line_2)
 
-        get_sampling_1 = line_mask[sampling_h1]
-        get_sampling_2 = line_mask[sampling_h2]
-
-        sampling_width_1 = np.sum(get_sampling_1 == 255)
-        sampling_width_2 = np.sum(get_sampling_2 == 255)
-
-        if sampling_width_1:
-            sam_1 = True
-        else:
-            sam_1 = False
-        if sampling_width_2:
-            sam_2 = True
-        else:
-            sam_2 = False
-
-        line_index_1 = np.where(get_sampling_1 == 255)
-        line_index_2 = np.where(get_sampling_2 == 255)
-
-        if sam_1:
-            sampling_1_left  = line_index_1[0][0]
-            sampling_1_right = line_index_1[0][sampling_width_1 - 1]
-            sampling_1_center= int((sampling_1_left + sampling_1_right) / 2)
-        if sam_2:
-            sampling_2_left  = line_index_2[0][0]
-            sampling_2_right = line_index_2[0][sampling_width_2 - 1]
-            sampling_2_center= int((sampling_2_left + sampling_2_right) / 2)
+        line_centers = [((left + right) / 2 * factor, y * factor) for y, left, right, _, _ in bands if left is not None]
+        sam_2 = bands[-1][1] is not None
 
         line_slope = 0
+        curvature = 0
         input_speed = 0
         input_turning = 0
-        if sam_1 and sam_2:
-            line_slope = (sampling_1_center - sampling_2_center) / abs(sampling_h1 - sampling_h2)
+        now = time.time() if prep.timestamp is None else prep.timestamp
+        if now - self.line_pid_time > self.line_follower.timeout:
+            # the last measurement is too old to take a derivative from
+            self.line_pid.reset()
+        if sam_2 and len(line_centers) >= 2:
+            xs, ys = np.array(line_centers, dtype=np.float64).T
+            # x over y, positive slope when the line leans right going away
+            line_slope = -np.polyfit(ys, xs, 1)[0]
+            if len(line_centers) >= 3:
+                curvature = np.polyfit(ys / height, xs / width, 2)[0]
             impact_by_slope = self.slope_on_speed * abs(line_slope)
-            # if impact_by_slope > input_speed:
-            #     impact_by_slope = input_speed
             input_speed = self.line_track_speed - impact_by_slope
-            # print(f'im_by_slope:{impact_by_slope}   input_speed:{input_speed}')
-            input_turning = -(line_slope * self.slope_impact + (sampling_2_center - center_x) * self.base_impact) #+ (speed_impact * input_speed)
-        elif not sam_1 and sam_2:
+            steering = line_slope * self.slope_impact + (line_centers[-1][0] - center_x) * self.base_impact + curvature * self.line_curve_impact
+            # with line_kp 1 and no ki / kd this is the plain slope and offset steering
+            input_turning = self.line_pid.update(steering, now - self.line_pid_time)
+        elif sam_2:
+            self.line_pid.reset()
             input_speed = 0
-            input_turning = (sampling_2_center - center_x) * self.base_impact
-        elif sam_1 and not sam_2:
+            input_turning = (line_centers[-1][0] - center_x) * self.base_impact
+        elif line_centers:
+            self.line_pid.reset()
             input_speed = (self.line_track_speed / 3)
             input_turning = 0
         else:
+            self.line_pid.reset()
             input_speed = - (self.line_track_speed / 3)
             input_turning = 0
-
-        # input_turning = - line_slope * slope_impact
-        # try:
-        #     input_turning = -(sampling_2_center - center_x) * base_impact
-        # except:
-        #     pass
-        if not self.cv_movtion_lock:
-            self.base_ctrl.base_json_ctrl({"T":13,"X":input_speed,"Z":input_turning})
-
-        overlay_buffer = np.zeros_like(img)
-        overlay_buffer = cv2.cvtColor(line_mask, cv2.COLOR_GRAY2BGR)
-
-        cv2.putText(overlay_buffer, 'Line Following', (100, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        cv2.circle(overlay_buffer, (center_x, center_y), int(self.sampling_rad/4), (64, 255, 64), 1)
-
-        cv2.putText(overlay_buffer, ' SAM_H1: {}'.format(self.sampling_line_1), (center_x-150, sampling_h1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, ' SAM_H2: {}'.format(self.sampling_line_2), (center_x-150, sampling_h2-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-
-        cv2.putText(overlay_buffer, f'X: {input_speed:.2f}, Z: {input_turning:.2f}', (center_x+50, center_y+0), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-        cv2.putText(overlay_buffer, ' UPPER: {}'.format(upper_hsv), (center_x+50, center_y+40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-        cv2.putText(overlay_buffer, ' LOWER: {}'.format(lower_hsv), (center_x+50, center_y+60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-        cv2.putText(overlay_buffer, ' UPPER: {}'.format(self.line_upper), (center_x+50, center_y+100), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, ' LOWER: {}'.format(self.line_lower), (center_x+50, center_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, f' SLOPE: {line_slope:.2f}', (center_x+50, center_y+140), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, f' SAM_1 SAM_2 SLOPE_IM BASE_IM SPD_IM LT_SPD SLOPE_SPD', (center_x-250, center_y-70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-        cv2.putText(overlay_buffer, f' {self.sampling_line_1:.2f}   {self.sampling_line_2:.2f}   {self.slope_impact:.2f}      {self.base_impact:.4f}  {self.speed_impact:.2f}    {self.line_track_speed:.2f}    {self.slope_on_speed:.2f}', (center_x-250, center_y-50), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 128, 128), 1)
-
-        cv2.line(overlay_buffer, (0, sampling_h1), (width, sampling_h1), (255, 0, 0), 2)
-        cv2.line(overlay_buffer, (0, sampling_h2), (width, sampling_h2), (255, 0, 0), 2)
-
-        if sam_1:
-            cv2.line(overlay_buffer, (sampling_1_left, sampling_h1+20), (sampling_1_left, sampling_h1-20), (0, 255, 0), 2)
-            cv2.line(overlay_buffer, (sampling_1_right, sampling_h1+20), (sampling_1_right, sampling_h1-20), (0, 255, 0), 2)
-        if sam_2:
-            cv2.line(overlay_buffer, (sampling_2_left, sampling_h2+20), (sampling_2_left, sampling_h2-20), (0, 255, 0), 2)
-            cv2.line(overlay_buffer, (sampling_2_right, sampling_h2+20), (sampling_2_right, sampling_h2-20), (0, 255, 0), 2)
-        if sam_1 and sam_2:
-            cv2.line(overlay_buffer, (sampling_1_center, sampling_h1), (sampling_2_center, sampling_h2), (255, 0, 0), 2)
-
-        self.overlay = overlay_buffer
-
-    def mediaPipe_faces(self, img):
-        image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.face_detection.process(image)
-
-        overlay_buffer = np.zeros_like(image)
-        cv2.putText(overlay_buffer, 'MediaPipe Faces', (100, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        if results.detections:
-            for detection in results.detections:
-                self.mpDraw.draw_detection(overlay_buffer, detection)
-        self.overlay = overlay_buffer
-
-    def mediaPipe_pose(self, img):
-        image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = self.pose.process(image)
-
-        overlay_buffer = np.zeros_like(image)
-        cv2.putText(overlay_buffer, 'MediaPipe Pose', (100, 70), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
-        if results.pose_landmarks:
-            self.mpDraw.draw_landmarks(overlay_buffer, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-        self.overlay = overlay_buffer
+        self.line_pid_time = now
+
+        # sent and predicted at line_cmd_rate by the follower thread, not once per frame
+        self.line_follower.set_drive(float(input_speed), float(input_turning), now)
+
+        overlay_buffer = DisplayList()
+        for y, left, right, band_mask, band_y0 in bands:
+            overlay_buffer.mask(band_mask, (255, 255, 255), origin=(0, band_y0 * factor), scale=factor)
+
+        overlay_buffer.text('Line Following', (100, 70), 0.6, (255, 255, 255), 1)
+        overlay_buffer.circle((center_x, center_y), int(self.sampling_rad/4), (64, 255, 64), 1)
+
+        overlay_buffer.text(' SAM_H1: {}'.format(self.sampling_line_1), (center_x-150, sampling_h1-10), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(' SAM_H2: {}'.format(self.sampling_line_2), (center_x-150, sampling_h2-10), 0.5, (255, 128, 128), 1)
+
+        overlay_buffer.text(f'X: {input_speed:.2f}, Z: {input_turning:.2f}', (center_x+50, center_y+0), 0.5, (255, 255, 255), 1)
+
+        overlay_buffer.text(' UPPER: {}'.format(upper_hsv), (center_x+50, center_y+40), 0.5, (255, 255, 255), 1)
+        overlay_buffer.text(' LOWER: {}'.format(lower_hsv), (center_x+50, center_y+60), 0.5, (255, 255, 255), 1)
+
+        overlay_buffer.text(' UPPER: {}'.format(self.line_upper), (center_x+50, center_y+100), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(' LOWER: {}'.format(self.line_lower), (center_x+50, center_y+120), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(f' SLOPE: {line_slope:.2f}', (center_x+50, center_y+140), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(f' SAM_1 SAM_2 SLOPE_IM BASE_IM SPD_IM LT_SPD SLOPE_SPD', (center_x-250, center_y-70), 0.5, (255, 128, 128), 1)
+        overlay_buffer.text(f' {self.sampling_line_1:.2f}   {self.sampling_line_2:.2f}   {self.slope_impact:.2f}      {self.base_impact:.4f}  {self.speed_impact:.2f}    {self.line_track_speed:.2f}    {self.slope_on_speed:.2f}', (center_x-250, center_y-50), 0.5, (255, 128, 128), 1)
+
+        overlay_buffer.line((0, sampling_h1), (width, sampling_h1), (255, 0, 0), 2)
+        overlay_buffer.line((0, sampling_h2), (width, sampling_h2), (255, 0, 0), 2)
+
+        for y, left, right, band_mask, band_y0 in bands:
+            if left is not None:
+                overlay_buffer.line((left * factor, y * factor + 20), (left * factor, y * factor - 20), (0, 255, 0), 2)
+                overlay_buffer.line((right * factor, y * factor + 20), (right * factor, y * factor - 20), (0, 255, 0), 2)
+        for i in range(1, len(line_centers)):
+            overlay_buffer.line(line_centers[i - 1], line_centers[i], (255, 0, 0), 2)
+
+        self.overlays['line'] = overlay_buffer
+        return Detections('line', (width, height), landmarks=np.array(line_centers, dtype=np.float32).reshape(1, -1, 2),
+                          extra={'slope': round(float(line_slope), 3), 'curvature': round(float(curvature), 3),
+                                 'speed': round(float(input_speed), 3), 'turning': round(float(input_turning), 3)})
+
+    def mediaPipe_faces(self, prep):
+        if not self.mp_tracks['mp_faces'].inference_due():
+            return self.react_mp_faces(None, prep.image.shape, prep.timestamp)
+        mp_faces = self.models.call('mp_faces', cv_detect.detect_mp_faces, prep.rgb(self.process_scale('mp_faces', prep)))
+        return self.react_mp_faces(mp_faces, prep.image.shape, prep.timestamp)
+
+    def react_mp_faces(self, mp_faces, frame_shape, timestamp=None):
+        # mp_faces None: no inference on this frame. boxes, scores and keypoints
+        # are smoothed together as (N, 17) rows
+        if mp_faces is None:
+            faces = self.mp_tracks['mp_faces'].predict(timestamp)
+        else:
+            boxes, scores, keypoints = mp_faces
+            faces = self.mp_tracks['mp_faces'].update(np.hstack([boxes, scores[:, None], keypoints.reshape(-1, 12)]), timestamp)
+        boxes, scores, keypoints = faces[:, :4], faces[:, 4], faces[:, 5:].reshape(-1, 6, 2)
+        overlay_buffer = DisplayList()
+        overlay_buffer.text('MediaPipe Faces', (100, 70), 0.6, (255, 255, 255), 1)
+        height, width = frame_shape[:2]
+        for (box_x, box_y, box_w, box_h), face_keypoints in zip(boxes, keypoints):
+            overlay_buffer.rectangle((box_x * width, box_y * height),
+                                     ((box_x + box_w) * width, (box_y + box_h) * height),
+                                     (255, 255, 255), 2)
+            overlay_buffer.landmarks(face_keypoints * (width, height))
+        self.overlays['mp_faces'] = overlay_buffer
+        face_boxes = boxes * (width, height, width, height)
+        face_boxes[:, 2:] += face_boxes[:, :2]
+        return Detections('mp_faces', (width, height), face_boxes, scores, landmarks=keypoints * (width, height))
+
+    def mediaPipe_pose(self, prep):
+        if not self.mp_tracks['pose'].inference_due():
+            return self.react_pose(None, prep.image.shape, prep.timestamp)
+        pose_landmarks = self.models.call('pose', cv_detect.detect_pose, prep.rgb(self.process_scale('pose', prep)))
+        return self.react_pose(pose_landmarks, prep.image.shape, prep.timestamp)
+
+    def react_pose(self, pose_landmarks, frame_shape, timestamp=None):
+        # pose_landmarks None: no inference on this frame
+        if pose_landmarks is None:
+            pose_landmarks = self.mp_tracks['pose'].predict(timestamp)
+        else:
+            pose_landmarks = self.mp_tracks['pose'].update(pose_landmarks, timestamp)
+        overlay_buffer = DisplayList()
+        overlay_buffer.text('MediaPipe Pose', (100, 70), 0.6, (255, 255, 255), 1)
+        height, width = frame_shape[:2]
+        pose_points = pose_landmarks * (width, height, 1, 1)
+        if len(pose_landmarks):
+            overlay_buffer.landmarks(pose_points[:, :2], cv_detect.mp_solution('pose').POSE_CONNECTIONS)
+        self.overlays['pose'] = overlay_buffer
+        return Detections('pose', (width, height), landmarks=pose_points.reshape(-1, 33, 4))
 
 
 
@@ -887,6 +1053,7 @@ class OpencvFuncs():
         wrapped_lines = textwrap.wrap(megs, self.recv_line_max)
         for line in wrapped_lines:
             self.info_deque.appendleft({'text':line,'color':color,'size':size})
+        self.info_version += 1
         self.info_update_time = time.time()
         self.show_info_flag = True
 
@@ -915,11 +1082,13 @@ class OpencvFuncs():
         try:
             if self.show_base_info_flag:
                 self.recv_deque.appendleft(json.dumps(self.format_json_numbers(input_data)))
+                self.recv_version += 1
             if input_data['T'] == 1003:
                 self.info_deque.appendleft({'text':json.dumps(input_data['mac']),'color':(16,64,255),'size':0.5})
                 wrapped_lines = textwrap.wrap(json.dumps(input_data['megs']), self.recv_line_max)
                 for line in wrapped_lines:
                     self.info_deque.appendleft({'text':line,'color':(255,255,255),'size':0.5})
+                self.info_version += 1
                 self.info_update_time = time.time()
                 self.show_info_flag = True
         except Exception as e:
@@ -928,26 +1097,41 @@ class OpencvFuncs():
 
 
 
-    def cv_process(self, frame):
-        cv_mode_list = {
-            f['code']['cv_moti']: self.cv_detect_movition,
-            f['code']['cv_face']: self.cv_detect_faces,
-            f['code']['cv_objs']: self.cv_detect_objects,
-            f['code']['cv_clor']: self.cv_detect_color,
-            f['code']['mp_hand']: self.mp_detect_hand,
-            f['code']['cv_auto']: self.cv_auto_drive,
-            f['code']['mp_face']: self.mediaPipe_faces,
-            f['code']['mp_pose']: self.mediaPipe_pose
-        }
-        try:
-            cv_mode_list[self.cv_mode](frame)
-        except Exception as e:
-            print(f'[cv_ctrl.cv_process] error: {e}')
-        self.cv_event.clear()
+    def make_prep(self, cv_frame):
+        # conversions are shared by every stage looking at this frame
+        return FrameCache(cv_frame.image, cv_frame.lores, self.lores_size, cv_frame.timestamp)
 
-    def opencv_threading(self, input_img):
-        cv_thread = threading.Thread(target=self.cv_process, args=(input_img,), daemon=True)
-        cv_thread.start()
+    def cv_stage_done(self, stage_name, detections, cv_frame):
+        self.publish_detections(detections, cv_frame.seq, cv_frame.timestamp)
+
+    def cv_apply_result(self, seq, timestamp, mode, result, shape, frame_shape):
+        # results from the process pool can arrive out of order, keep the newest only
+        if seq <= self.overlay_seq or self.cv_process_modes.get(self.cv_mode) != mode:
+            return
+        result = cv_detect.scale_result(mode, result, frame_shape[1] / shape[1])
+        detections = self.cv_reactions[mode](result, frame_shape, timestamp)
+        self.overlay_seq = seq
+        self.publish_detections(detections, seq, timestamp)
+
+    def publish_detections(self, detections, seq, timestamp):
+        if detections is None:
+            return
+        detections.seq = seq
+        detections.timestamp = timestamp
+        self.detections[detections.mode] = detections
+
+    def stage_detections_dict(self, stage_name):
+        detections = self.detections.get(stage_name)
+        if detections is None:
+            return {'mode': stage_name, 'seq': self.frame_seq, 'ts': round(time.time(), 3)}
+        return detections.to_dict()
+
+    def detections_dict(self):
+        return {
+            'seq': self.frame_seq,
+            'ts': round(time.time(), 3),
+            'stages': {name: detections.to_dict() for name, detections in list(self.detections.items())}
+        }
 
     def head_light_ctrl(self, input_mode):
         self.cv_light_mode = input_mode
@@ -972,6 +1156,7 @@ class OpencvFuncs():
             self.cv_movtion_lock = False
             self.pan_angle = 0
             self.tilt_angle = 0
+            self.gimbal.reset(0, 0)
         else:
             self.cv_movtion_lock = True
 
@@ -981,11 +1166,13 @@ class OpencvFuncs():
     def change_target_color(self, lc, uc):
         self.color_lower = np.array([lc[0], lc[1], lc[2]])
         self.color_upper = np.array([uc[0], uc[1], uc[2]])
+        self.color_track.set_ranges([(self.color_lower, self.color_upper)])
 
     def selet_target_color(self, color_name):
         if color_name in self.color_list:
             self.color_lower = self.color_list[color_name][0]
             self.color_upper = self.color_list[color_name][1]
+            self.color_track.set_ranges([(self.color_lower, self.color_upper)])
 
     def change_line_color(self, lc, uc):
         self.line_lower = np.array([lc[0], lc[1], lc[2]])
@@ -1009,8 +1196,10 @@ class OpencvFuncs():
             self.track_faces_iterate = float(args_2)
         elif args_1 == '-s' or args_1 == '--speed':
             self.track_spd_rate = float(args_2)
+            self.gimbal.spd_rate = self.track_spd_rate
         elif args_1 == '-a' or args_1 == '--acc':
             self.track_acc_rate = float(args_2)
+            self.gimbal.acc_rate = self.track_acc_rate
 
     def timelapse(self, input_speed, input_time, input_interval, input_loop_times):
         self.mission_flag = True
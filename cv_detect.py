@@ -0,0 +1,261 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import yaml
+
+import cv_dnn
+
+curpath = os.path.realpath(__file__)
+thisPath = os.path.dirname(curpath)
+with open(thisPath + '/config.yaml', 'r') as yaml_file:
+    f = yaml.safe_load(yaml_file)
+
+# detection funcs without side effects. they only need the frame and the
+# model, so they can run in the cv thread or in a worker process, and they
+# return compact numpy results instead of drawing anything.
+
+
+class FrameCache():
+    """derived images of one frame, each built at most once on first use and
+    shared by every cv func looking at the same frame.
+    scale is a float downscale factor or 'lores' for the camera lores stream,
+    a (h * 3 / 2, w) yuv420 buffer whose Y plane is lores_size.
+    safe to share between threads, each image has its own build lock so
+    stages waiting on different images don't block each other.
+    timestamp is when the frame was taken, if known."""
+    def __init__(self, image, lores=None, lores_size=None, timestamp=None):
+        self.image = image
+        self.timestamp = timestamp
+        self.lores = lores
+        self.lores_size = lores_size
+        self.items = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        item = self.items.get(key)
+        if item is not None:
+            self.hits += 1
+            return item
+        with self.lock:
+            key_lock = self.locks.setdefault(key, threading.Lock())
+        with key_lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                item = self.items[key] = build()
+            else:
+                self.hits += 1
+        return item
+
+    def has_lores(self, color=False):
+        # the yuv420 buffer only converts to bgr when its rows are not padded
+        if self.lores is None:
+            return False
+        return not color or self.lores.shape[1] == self.lores_size[0]
+
+    def size(self, scale=1):
+        # (w, h) of the images at scale
+        h, w = self.image.shape[:2]
+        if scale == 'lores':
+            return self.lores_size
+        elif scale >= 1:
+            return (w, h)
+        return (max(1, round(w * scale)), max(1, round(h * scale)))
+
+    def factor(self, scale=1):
+        # maps coordinates at scale back onto the frame
+        return self.image.shape[1] / self.size(scale)[0]
+
+    def bgr(self, scale=1):
+        if scale == 'lores':
+            return self.get(('bgr', scale), lambda: cv2.cvtColor(self.lores, cv2.COLOR_YUV2BGR_I420))
+        elif scale >= 1:
+            return self.image
+        return self.get(('bgr', scale), lambda: cv2.resize(self.image, self.size(scale), interpolation=cv2.INTER_AREA))
+
+    def gray(self, scale=1, blur=0):
+        # blur is applied after the conversion
+        if blur:
+            return self.get(('gray', scale, blur), lambda: cv2.GaussianBlur(self.gray(scale), (blur, blur), 0))
+        if scale == 'lores':
+            return self.lores[:self.lores_size[1], :self.lores_size[0]]
+        src = self.bgr(scale)
+        if src.ndim == 2:
+            return src
+        return self.get(('gray', scale, 0), lambda: cv2.cvtColor(src, cv2.COLOR_BGR2GRAY))
+
+    def rgb(self, scale=1):
+        return self.get(('rgb', scale), lambda: cv2.cvtColor(self.bgr(scale), cv2.COLOR_BGR2RGB))
+
+
+class Detections():
+    """what one cv mode found in one frame, in frame pixel coordinates.
+    boxes: (N, 4) x0, y0, x1, y1 / scores: (N,) / labels: N strings /
+    landmarks: (N, K, D) points per detection / extra: mode specific values"""
+    __slots__ = ('mode', 'seq', 'timestamp', 'frame_size', 'boxes', 'scores', 'labels', 'landmarks', 'extra')
+
+    def __init__(self, mode, frame_size, boxes=None, scores=None, labels=None, landmarks=None, extra=None):
+        self.mode = mode
+        self.seq = 0
+        self.timestamp = 0
+        self.frame_size = frame_size
+        self.boxes = np.zeros((0, 4), dtype=np.float32) if boxes is None else np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.ones(len(self.boxes), dtype=np.float32) if scores is None else np.asarray(scores, dtype=np.float32)
+        self.labels = labels if labels is not None else [mode] * len(self.boxes)
+        self.landmarks = None if landmarks is None else np.asarray(landmarks, dtype=np.float32)
+        self.extra = extra or {}
+
+    def __len__(self):
+        return max(len(self.boxes), 0 if self.landmarks is None else len(self.landmarks))
+
+    def changed(self, other, tolerance=2.0):
+        # delta suppression: False when other holds the same findings within tolerance pixels
+        if other is None or other.mode != self.mode or other.labels != self.labels:
+            return True
+        if self.boxes.shape != other.boxes.shape or not np.allclose(self.boxes, other.boxes, atol=tolerance):
+            return True
+        if (self.landmarks is None) != (other.landmarks is None):
+            return True
+        if self.landmarks is not None and (self.landmarks.shape != other.landmarks.shape or
+                                           not np.allclose(self.landmarks[..., :2], other.landmarks[..., :2], atol=tolerance)):
+            return True
+        return self.extra != other.extra
+
+    def to_dict(self):
+        record = {
+            'mode': self.mode,
+            'seq': self.seq,
+            'ts': round(self.timestamp, 3),
+            'size': list(self.frame_size),
+            'boxes': np.round(self.boxes.astype(float), 1).tolist(),
+            'scores': np.round(self.scores.astype(float), 3).tolist(),
+            'labels': list(self.labels)
+        }
+        if self.landmarks is not None:
+            record['landmarks'] = np.round(self.landmarks.astype(float), 1).tolist()
+        if self.extra:
+            record['extra'] = self.extra
+        return record
+
+
+def detect_faces(gray_img, face_cascade):
+    # -> (N, 4) int32 x, y, w, h
+    faces = face_cascade.detectMultiScale(
+            gray_img,
+            scaleFactor=1.2,
+            minNeighbors=5,
+            minSize=(20, 20)
+        )
+    if len(faces) == 0:
+        return np.zeros((0, 4), dtype=np.int32)
+    return np.asarray(faces, dtype=np.int32)
+
+
+def detect_objects(img, net):
+    # img: rgb, net: a cv_dnn.DnnBackend -> (N, 6) float32 class_id, confidence, x0, y0, x1, y1 in pixels
+    (h, w) = img.shape[:2]
+    return cv_dnn.filter_detections(net.run(cv_dnn.ssd_blob(img)), (w, h))
+
+
+def detect_hands(img, hands):
+    # img: rgb -> (N, 21, 3) float32 normalized landmarks
+    results = hands.process(img)
+    if not results.multi_hand_landmarks:
+        return np.zeros((0, 21, 3), dtype=np.float32)
+    return np.array([[(lm.x, lm.y, lm.z) for lm in hand_lms.landmark]
+                     for hand_lms in results.multi_hand_landmarks], dtype=np.float32)
+
+
+def detect_mp_faces(img, face_detection):
+    # img: rgb -> (N, 4) float32 normalized x, y, w, h / (N,) scores / (N, 6, 2) normalized keypoints
+    results = face_detection.process(img)
+    if not results.detections:
+        return (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+                np.zeros((0, 6, 2), dtype=np.float32))
+    boxes, scores, keypoints = [], [], []
+    for detection in results.detections:
+        bbox = detection.location_data.relative_bounding_box
+        boxes.append((bbox.xmin, bbox.ymin, bbox.width, bbox.height))
+        scores.append(detection.score[0] if detection.score else 0)
+        keypoints.append([(kp.x, kp.y) for kp in detection.location_data.relative_keypoints])
+    return (np.array(boxes, dtype=np.float32), np.array(scores, dtype=np.float32),
+            np.array(keypoints, dtype=np.float32).reshape(-1, 6, 2))
+
+
+def detect_pose(img, pose):
+    # img: rgb -> (33, 4) float32 normalized x, y, z, visibility, empty when no pose was found
+    results = pose.process(img)
+    if not results.pose_landmarks:
+        return np.zeros((0, 4), dtype=np.float32)
+    return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in results.pose_landmarks.landmark], dtype=np.float32)
+
+
+def scale_result(name, result, factor):
+    # map a detector result from a downscaled input back to the frame it came from,
+    # the mediapipe results are normalized and need no remapping
+    if factor == 1:
+        return result
+    if name == 'faces':
+        return np.round(result * factor).astype(np.int32)
+    elif name == 'objects':
+        result = result.copy()
+        result[:, 2:6] *= factor
+        return result
+    return result
+
+
+def load_model(name, project_path):
+    # models for a worker process, each process loads its own on first use
+    if name == 'faces':
+        return cv2.CascadeClassifier(project_path + '/models/haarcascade_frontalface_default.xml')
+    elif name == 'objects':
+        return cv_dnn.load_object_detector(project_path)
+    import mediapipe as mp
+    if name == 'hands':
+        return mp.solutions.hands.Hands(max_num_hands=1, model_complexity=f['cv']['hands_complexity'])
+    elif name == 'mp_faces':
+        return mp.solutions.face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+    elif name == 'pose':
+        return mp.solutions.pose.Pose(static_image_mode=False,
+                                      model_complexity=f['cv']['pose_complexity'],
+                                      smooth_landmarks=True,
+                                      min_detection_confidence=0.5,
+                                      min_tracking_confidence=0.5)
+    raise ValueError(f"unknown model: {name}")
+
+
+def set_opencv_threads(threads=None):
+    # cv2.setNumThreads is process wide, each process sets it once at startup. 0 keeps the opencv default
+    threads = f['cv']['opencv_threads'] if threads is None else threads
+    if threads:
+        cv2.setNumThreads(threads)
+
+
+def mp_solution(name):
+    # a mediapipe solution module for its landmark names and connections,
+    # mediapipe is only imported once a mode needs it
+    import mediapipe as mp
+    return getattr(mp.solutions, name)
+
+
+# which FrameCache image each detector takes
+DETECTOR_INPUTS = {
+    'faces': 'gray',
+    'objects': 'rgb',
+    'hands': 'rgb',
+    'mp_faces': 'rgb',
+    'pose': 'rgb'
+}
+
+DETECTORS = {
+    'faces': detect_faces,
+    'objects': detect_objects,
+    'hands': detect_hands,
+    'mp_faces': detect_mp_faces,
+    'pose': detect_pose
+}
@@ -0,0 +1,221 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+from cv_profile import Histogram
+from cv_track import iou_matrix
+
+curpath = os.path.realpath(__file__)
+thisPath = os.path.dirname(curpath)
+with open(thisPath + '/config.yaml', 'r') as yaml_file:
+    f = yaml.safe_load(yaml_file)
+
+# ssd input, the same for every variant of the model
+SSD_SIZE = (300, 300)
+SSD_SCALE = 0.007843
+SSD_MEAN = 127.5
+SSD_CONFIDENCE = 0.2
+
+
+def ssd_blob(img):
+    return cv2.dnn.blobFromImage(cv2.resize(img, SSD_SIZE), SSD_SCALE, SSD_SIZE, SSD_MEAN)
+
+
+class DnnBackend():
+    """one way of running the object ssd, described by an entry of
+    cv.object_backends. run(blob) -> (N, 7) DetectionOutput rows
+    image_id, class_id, confidence, x0, y0, x1, y1 normalized, so every
+    variant of the model has to end in the ssd DetectionOutput layer. onnx or
+    tflite ssd exports that output raw boxes and scores are not supported, an
+    onnx entry needs a model converted with DetectionOutput kept."""
+    def __init__(self, spec):
+        self.spec = spec
+        self.name = spec['name']
+
+    def load(self, project_path, threads=0):
+        raise NotImplementedError
+
+    def run(self, blob):
+        raise NotImplementedError
+
+    def warmup(self, runs=2):
+        blob = np.zeros((1, 3) + SSD_SIZE, dtype=np.float32)
+        for _ in range(runs):
+            self.run(blob)
+
+
+class OpencvDnnBackend(DnnBackend):
+    """cv2.dnn.readNet, caffe or onnx. threads is not used here,
+    cv2.setNumThreads is process wide and set once at startup from
+    cv.opencv_threads, see cv_detect.set_opencv_threads."""
+    BACKENDS = {
+        'default': cv2.dnn.DNN_BACKEND_DEFAULT,
+        'opencv': cv2.dnn.DNN_BACKEND_OPENCV,
+        'openvino': cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE,
+        'vulkan': cv2.dnn.DNN_BACKEND_VKCOM
+    }
+    TARGETS = {
+        'cpu': cv2.dnn.DNN_TARGET_CPU,
+        'cpu_fp16': getattr(cv2.dnn, 'DNN_TARGET_CPU_FP16', cv2.dnn.DNN_TARGET_CPU),
+        'opencl': cv2.dnn.DNN_TARGET_OPENCL,
+        'opencl_fp16': cv2.dnn.DNN_TARGET_OPENCL_FP16,
+        'vulkan': cv2.dnn.DNN_TARGET_VULKAN
+    }
+
+    def load(self, project_path, threads=0):
+        config = self.spec.get('config')
+        self.net = cv2.dnn.readNet(os.path.join(project_path, self.spec['model']),
+                                   os.path.join(project_path, config) if config else '')
+        self.net.setPreferableBackend(self.BACKENDS[self.spec.get('backend', 'default')])
+        self.net.setPreferableTarget(self.TARGETS[self.spec.get('target', 'cpu')])
+
+    def run(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward().reshape(-1, 7)
+
+
+class OnnxRuntimeBackend(DnnBackend):
+    """onnxruntime on the cpu, threads sizes this session's own pool"""
+    def load(self, project_path, threads=0):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(os.path.join(project_path, self.spec['model']), options,
+                                                    providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def run(self, blob):
+        return np.asarray(self.session.run(None, {self.input_name: blob})[0]).reshape(-1, 7)
+
+
+def create_backend(spec):
+    if spec.get('backend') == 'onnxruntime':
+        return OnnxRuntimeBackend(spec)
+    return OpencvDnnBackend(spec)
+
+
+def load_backend(spec, project_path, threads=None, warmup=None):
+    threads = f['cv']['dnn_threads'] if threads is None else threads
+    warmup = f['cv']['dnn_warmup'] if warmup is None else warmup
+    backend = create_backend(spec)
+    backend.load(project_path, threads)
+    if warmup:
+        backend.warmup(warmup)
+    return backend
+
+
+def load_object_detector(project_path):
+    # cv.object_backend names an entry of cv.object_backends, auto takes the one
+    # cv_bench.py --dnn picked, or else the first entry that loads
+    specs = f['cv']['object_backends']
+    name = f['cv']['object_backend']
+    if name == 'auto':
+        name = load_selection(project_path)
+    if name is not None:
+        specs = [spec for spec in specs if spec['name'] == name] + [spec for spec in specs if spec['name'] != name]
+    for spec in specs:
+        try:
+            backend = load_backend(spec, project_path)
+            print(f"[cv_dnn.load_object_detector] using {spec['name']}")
+            return backend
+        except Exception as e:
+            print(f"[cv_dnn.load_object_detector] {spec['name']} error: {e}")
+    raise RuntimeError("no object detector backend could be loaded")
+
+
+def selection_file(project_path):
+    return os.path.join(project_path, f['cv']['object_backend_file'])
+
+
+def load_selection(project_path):
+    try:
+        with open(selection_file(project_path)) as selection:
+            return json.load(selection)['selected']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def save_selection(project_path, selected, reports):
+    with open(selection_file(project_path), 'w') as selection:
+        json.dump({'selected': selected, 'time': time.time(), 'reports': reports}, selection, indent=2)
+
+
+def filter_detections(rows, frame_size):
+    # -> (N, 6) class_id, confidence, x0, y0, x1, y1 in pixels
+    rows = rows[rows[:, 2] > SSD_CONFIDENCE]
+    w, h = frame_size
+    objects = np.empty((len(rows), 6), dtype=np.float32)
+    objects[:, 0] = rows[:, 1]
+    objects[:, 1] = rows[:, 2]
+    objects[:, 2:6] = rows[:, 3:7] * np.array([w, h, w, h], dtype=np.float32)
+    return objects
+
+
+def agreement(reference, objects, iou_threshold=0.5):
+    # -> (matched, reference count, count), a match is the same class at iou_threshold
+    if not len(reference) or not len(objects):
+        return 0, len(reference), len(objects)
+    iou = iou_matrix(reference[:, 2:6], objects[:, 2:6])
+    iou[reference[:, None, 0] != objects[None, :, 0]] = 0
+    matched = 0
+    while True:
+        best = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[best] < iou_threshold:
+            break
+        matched += 1
+        iou[best[0], :] = 0
+        iou[:, best[1]] = 0
+    return matched, len(reference), len(objects)
+
+
+def benchmark(specs, frames, project_path, threads=None):
+    """runs every backend over the same rgb frames. the first entry that loads is
+    the reference, accuracy is the f1 of the other backends against its
+    detections. -> one report per entry."""
+    reports = []
+    reference = None
+    for spec in specs:
+        report = {'name': spec['name'], 'backend': spec.get('backend', 'default'), 'target': spec.get('target', 'cpu')}
+        try:
+            start_time = time.perf_counter()
+            backend = load_backend(spec, project_path, threads)
+            report['load_ms'] = round((time.perf_counter() - start_time) * 1000, 1)
+        except Exception as e:
+            report['error'] = str(e)
+            reports.append(report)
+            continue
+        latency = Histogram()
+        results = []
+        for frame in frames:
+            blob = ssd_blob(frame)
+            start = time.perf_counter_ns()
+            rows = backend.run(blob)
+            latency.record(time.perf_counter_ns() - start)
+            results.append(filter_detections(rows, (frame.shape[1], frame.shape[0])))
+        report['latency'] = latency.summary()
+        if reference is None:
+            reference = results
+            report['reference'] = True
+            report['accuracy'] = 1.0
+        else:
+            matched = expected = found = 0
+            for expected_objects, objects in zip(reference, results):
+                m, e, c = agreement(expected_objects, objects)
+                matched, expected, found = matched + m, expected + e, found + c
+            report['accuracy'] = round(2 * matched / (expected + found), 3) if expected + found else 1.0
+        report['min_accuracy'] = spec.get('min_accuracy', f['cv']['object_min_accuracy'])
+        reports.append(report)
+    return reports
+
+
+def select_backend(reports):
+    # the fastest backend whose accuracy meets its own threshold
+    passing = [report for report in reports if 'error' not in report and report['accuracy'] >= report['min_accuracy']]
+    if not passing:
+        return None
+    return min(passing, key=lambda report: report['latency']['mean_ms'])['name']
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class AlphaBeta():
+    """alpha beta filter on a vector, x the position and v its change per
+    second. alpha weighs the measurement against the prediction, beta how fast
+    the velocity follows the residual."""
+    def __init__(self, alpha=0.5, beta=0.1):
+        self.alpha = alpha
+        self.beta = beta
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.v = None
+        self.t = None
+
+    def update(self, z, t):
+        z = np.asarray(z, dtype=np.float64)
+        if self.x is None:
+            self.x = z.copy()
+            self.v = np.zeros_like(z)
+            self.t = t
+            return self.x
+        dt = t - self.t
+        if dt <= 0:
+            # same or older frame, no time to derive a velocity from
+            self.x += self.alpha * (z - self.x)
+            return self.x
+        predicted = self.x + self.v * dt
+        residual = z - predicted
+        self.x = predicted + self.alpha * residual
+        self.v = self.v + self.beta * residual / dt
+        self.t = t
+        return self.x
+
+    def predict(self, t):
+        return self.x + self.v * max(0, t - self.t)
+
+
+class GimbalController(threading.Thread):
+    """points the pan tilt gimbal at a target seen in the camera image.
+    observe() takes the pixel error of the target from the image center and
+    turns it into the absolute angles of the target, using the pose the gimbal
+    was commanded to when the frame was taken, i.e. latency seconds before the
+    result arrived. an alpha beta filter tracks those angles, and the thread
+    sends the prediction for now at a fixed rate, independent of how often
+    the cv modes detect. errors inside deadband pixels count as aimed, steps
+    below min_step degrees are not sent, and once no target came for timeout
+    seconds nothing is sent at all. the commanded pose stands in for the
+    measured one, the gimbal does not report its angles fast enough.
+    with threaded False no thread is started and the caller sends what
+    step(now) returns, cv_bench does that once per replayed frame."""
+    PAN_LIMITS = (-180, 180)
+    TILT_LIMITS = (-30, 90)
+
+    def __init__(self, send, rate=20, alpha=0.5, beta=0.1, latency=0.1, deadband=4, min_step=0.5,
+                 spd_rate=60, acc_rate=0.4, timeout=0.5, threaded=True):
+        super(GimbalController, self).__init__(daemon=True)
+        self.send = send
+        self.rate = rate
+        self.latency = latency
+        self.deadband = deadband
+        self.min_step = min_step
+        self.spd_rate = spd_rate
+        self.acc_rate = acc_rate
+        self.timeout = timeout
+        self.threaded = threaded
+        self.filter = AlphaBeta(alpha, beta)
+        self.lock = threading.Lock()
+        self.pan = 0.0
+        self.tilt = 0.0
+        # (time, pan, tilt) of the commands sent, base_pose is the pose before the oldest one
+        self.history = deque(maxlen=max(2, int(rate * 2)))
+        self.base_pose = (0.0, 0.0)
+        self.iterate = 1.0
+        self.updated = 0
+        self.observed = 0
+        self.sent = 0
+        self.suppressed = 0
+        self.__flag = threading.Event()
+        self.__flag.set()
+
+    def reset(self, pan=0.0, tilt=0.0):
+        with self.lock:
+            self.pan = pan
+            self.tilt = tilt
+            self.history.clear()
+            self.base_pose = (pan, tilt)
+            self.filter.reset()
+            self.updated = 0
+
+    def pose_at(self, t):
+        # the last pose commanded at or before t, a frame older than every
+        # command was taken at the pose from before the first of them
+        for sent_time, pan, tilt in reversed(self.history):
+            if sent_time <= t:
+                return pan, tilt
+        return self.base_pose
+
+    def clamp(self, pan, tilt):
+        return (min(max(pan, self.PAN_LIMITS[0]), self.PAN_LIMITS[1]),
+                min(max(tilt, self.TILT_LIMITS[0]), self.TILT_LIMITS[1]))
+
+    def observe(self, error_x, error_y, iterate, timestamp=None, now=None):
+        """error_x right and error_y up in pixels, iterate in degrees per pixel.
+        timestamp is when the frame was taken, if known, latency is assumed
+        otherwise. -> pixel distance of the target from the center"""
+        now = time.time() if now is None else now
+        frame_time = now - self.latency if timestamp is None else timestamp
+        distance = float(np.hypot(error_x, error_y))
+        if abs(error_x) <= self.deadband:
+            error_x = 0
+        if abs(error_y) <= self.deadband:
+            error_y = 0
+        with self.lock:
+            pan, tilt = self.pose_at(frame_time)
+            # a target lost for longer than timeout starts over without its old velocity
+            if now - self.updated > self.timeout:
+                self.filter.reset()
+            self.filter.update(self.clamp(pan + error_x * iterate, tilt + error_y * iterate), frame_time)
+            self.iterate = iterate
+            self.updated = now
+            self.observed += 1
+        if self.threaded and self.ident is None:
+            self.start()
+        return distance
+
+    def step(self, now):
+        # -> the command to send now, None when there is nothing new
+        with self.lock:
+            if self.filter.x is None or now - self.updated > self.timeout:
+                return None
+            pan, tilt = self.clamp(*map(float, self.filter.predict(now)))
+            delta = max(abs(pan - self.pan), abs(tilt - self.tilt))
+            if delta < self.min_step:
+                self.suppressed += 1
+                return None
+            distance = np.hypot(pan - self.pan, tilt - self.tilt) / max(self.iterate, 1e-6)
+            if len(self.history) == self.history.maxlen:
+                self.base_pose = self.history[0][1:]
+            self.history.append((now, pan, tilt))
+            self.pan, self.tilt = pan, tilt
+        return (round(pan, 2), round(tilt, 2),
+                max(1, int(distance * self.spd_rate)), max(1, int(distance * self.acc_rate)))
+
+    def stop(self):
+        self.__flag.clear()
+
+    def run(self):
+        next_send = time.time()
+        while self.__flag.is_set():
+            now = time.time()
+            command = self.step(now)
+            if command is not None:
+                try:
+                    self.send(*command)
+                    self.sent += 1
+                except Exception as e:
+                    print(f"[cv_gimbal.run] error: {e}")
+            # whole periods, a late send does not shift the cadence
+            next_send = max(next_send + 1 / self.rate, now)
+            time.sleep(max(0, next_send - time.time()))
+
+    def stats(self):
+        with self.lock:
+            velocity = None if self.filter.v is None else [round(float(v), 2) for v in self.filter.v]
+            return {
+                'rate': self.rate,
+                'pan': round(self.pan, 2),
+                'tilt': round(self.tilt, 2),
+                'velocity': velocity,
+                'tracking': time.time() - self.updated <= self.timeout,
+                'observed': self.observed,
+                'sent': self.sent,
+                'suppressed': self.suppressed
+            }
@@ -0,0 +1,141 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from cv_gimbal import AlphaBeta
+
+
+class Pid():
+    """pid on error = setpoint - measurement. the derivative is taken on the
+    measurement, so setpoint steps don't kick, and low pass filtered with time
+    constant d_filter seconds. the integral is clamped to i_limit."""
+    def __init__(self, kp=1.0, ki=0.0, kd=0.0, d_filter=0.1, i_limit=1.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.d_filter = d_filter
+        self.i_limit = i_limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_measurement = None
+
+    def update(self, measurement, dt, setpoint=0.0):
+        error = setpoint - measurement
+        if self.last_measurement is not None and dt > 0:
+            self.integral = min(max(self.integral + error * dt, -self.i_limit), self.i_limit)
+            raw = -(measurement - self.last_measurement) / dt
+            alpha = dt / (self.d_filter + dt)
+            self.derivative += alpha * (raw - self.derivative)
+        self.last_measurement = measurement
+        return self.kp * error + self.ki * self.integral + self.kd * self.derivative
+
+
+def band_rows(count, first, last):
+    # count band positions from first to last, as fractions of the height
+    if count <= 1:
+        return [last]
+    return [first + (last - first) * i / (count - 1) for i in range(count)]
+
+
+def measure_bands(bgr, rows, lower, upper, band_height=6):
+    """only the bands are converted and thresholded, not the frame.
+    -> per row fraction (y, left, right, band mask) with left / right None when
+    the line is not in that band, all in bgr pixels"""
+    height, width = bgr.shape[:2]
+    kernel = np.ones((1, 5), dtype=np.uint8)
+    bands = []
+    for row in rows:
+        y = min(int(height * row), height - 1)
+        y0 = max(0, y - band_height // 2)
+        band = cv2.inRange(cv2.cvtColor(bgr[y0:y0 + band_height], cv2.COLOR_BGR2HSV), lower, upper)
+        # a column is line when most of the band is, then drop specks narrower than the kernel
+        line = (np.count_nonzero(band, axis=0) * 2 > band.shape[0]).astype(np.uint8)[None]
+        line = cv2.morphologyEx(line, cv2.MORPH_OPEN, kernel)[0]
+        index = np.flatnonzero(line)
+        if len(index):
+            bands.append((y, int(index[0]), int(index[-1]), band, y0))
+        else:
+            bands.append((y, None, None, band, y0))
+    return bands
+
+
+class LineFollower(threading.Thread):
+    """sends drive commands at a fixed rate above the frame rate, independent
+    of how often the line is measured. set_drive(speed, turning, now) after
+    every measurement, now being when its frame was taken. between
+    measurements the command is predicted from how fast it changed, an alpha
+    beta filter with alpha 1 so a measurement goes out as it is, for at most
+    max_extrapolate seconds past the last one, after that it is held.
+    send(speed, turning) does the sending. once no measurement came for
+    timeout seconds the base gets one stop and nothing after it, and it gets
+    a stop when the thread ends. with threaded False no thread is started and
+    the caller sends what step(now) returns, cv_bench does that once per
+    replayed frame."""
+    def __init__(self, send, rate=60, timeout=0.5, beta=0.3, max_extrapolate=0.1, threaded=True):
+        super(LineFollower, self).__init__(daemon=True)
+        self.send = send
+        self.rate = rate
+        self.timeout = timeout
+        self.max_extrapolate = max_extrapolate
+        self.threaded = threaded
+        self.filter = AlphaBeta(1.0, beta)
+        self.lock = threading.Lock()
+        self.updated = 0
+        self.stopped = True
+        self.sent = 0
+        self.errors = 0
+        self.__flag = threading.Event()
+        self.__flag.set()
+
+    def set_drive(self, speed, turning, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if now - self.updated > self.timeout:
+                # a stopped follower starts over, no velocity across the gap
+                self.filter.reset()
+            self.filter.update((speed, turning), now)
+            self.updated = now
+            self.stopped = False
+        if self.threaded and self.ident is None:
+            self.start()
+
+    def step(self, now):
+        # -> the command to send now, None when there is nothing to send
+        with self.lock:
+            if now - self.updated > self.timeout:
+                if self.stopped:
+                    return None
+                self.stopped = True
+                return (0, 0)
+            speed, turning = self.filter.predict(min(now, self.updated + self.max_extrapolate))
+        return (round(float(speed), 4), round(float(turning), 4))
+
+    def stop(self):
+        self.__flag.clear()
+
+    def send_command(self, command):
+        try:
+            self.send(*command)
+            self.sent += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[cv_line.LineFollower] error: {e}")
+
+    def run(self):
+        next_send = time.time()
+        try:
+            while self.__flag.is_set():
+                now = time.time()
+                command = self.step(now)
+                if command is not None:
+                    self.send_command(command)
+                # whole periods, a late send does not shift the cadence
+                next_send = max(next_send + 1 / self.rate, now)
+                time.sleep(max(0, next_send - time.time()))
+        finally:
+            self.send_command((0, 0))
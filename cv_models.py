@@ -0,0 +1,177 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import cv_detect
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_bytes():
+    # current resident set size, 0 where /proc is not there
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class ModelRegistry():
+    """cv models loaded when a mode first asks for them instead of at startup.
+    get(name) loads under a per model lock, so two stages asking at once load
+    it only once. models not asked for in idle_unload seconds are dropped again,
+    0 keeps them for good, and a model is never unloaded while it is in use(),
+    call() is the one line form of that. a load that failed is not retried for
+    RETRY_MIN seconds, doubling up to RETRY_MAX. the rss delta of a load is only
+    a rough memory cost, other threads allocate at the same time."""
+    CHECK_INTERVAL = 10
+    RETRY_MIN = 5
+    RETRY_MAX = 300
+
+    def __init__(self, project_path, idle_unload=0, loader=None):
+        self.project_path = project_path
+        self.idle_unload = idle_unload
+        self.loader = loader or cv_detect.load_model
+        self.models = {}
+        self.info = {}
+        self.locks = {}
+        self.users = {}
+        self.failures = {}
+        self.lock = threading.Lock()
+        self.unload_thread = None
+
+    def model_lock(self, name):
+        with self.lock:
+            return self.locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        model = self.models.get(name)
+        if model is None:
+            with self.model_lock(name):
+                model = self.models.get(name)
+                if model is None:
+                    model = self.load_or_backoff(name)
+        self.info[name]['last_used'] = time.time()
+        return model
+
+    @contextmanager
+    def use(self, name):
+        # the model can not be unloaded until the block is left
+        with self.model_lock(name):
+            model = self.models.get(name)
+            if model is None:
+                model = self.load_or_backoff(name)
+            self.users[name] = self.users.get(name, 0) + 1
+        try:
+            yield model
+        finally:
+            with self.model_lock(name):
+                self.users[name] -= 1
+                self.info[name]['last_used'] = time.time()
+
+    def call(self, name, func, *args):
+        # -> func(*args, model) with the model held
+        with self.use(name) as model:
+            return func(*args, model)
+
+    def load_or_backoff(self, name):
+        # called under the model lock
+        now = time.time()
+        failure = self.failures.get(name)
+        if failure is not None and now < failure['retry_at']:
+            raise RuntimeError(f"{name} failed to load, next try in {round(failure['retry_at'] - now)}s: {failure['error']}")
+        try:
+            model = self.load(name)
+        except Exception as e:
+            delay = self.RETRY_MIN if failure is None else min(failure['delay'] * 2, self.RETRY_MAX)
+            self.failures[name] = {'error': str(e), 'delay': delay, 'retry_at': now + delay,
+                                   'count': 1 if failure is None else failure['count'] + 1}
+            print(f"[cv_models.load] {name} error: {e}, next try in {delay}s")
+            raise
+        self.failures.pop(name, None)
+        return model
+
+    def load(self, name):
+        rss_before = rss_bytes()
+        start_time = time.perf_counter()
+        model = self.loader(name, self.project_path)
+        load_time = time.perf_counter() - start_time
+        info = self.info.setdefault(name, {'loads': 0})
+        info['loads'] += 1
+        info['load_ms'] = round(load_time * 1000, 1)
+        info['rss_mb'] = round((rss_bytes() - rss_before) / 1048576, 1)
+        info['last_used'] = time.time()
+        self.models[name] = model
+        print(f"[cv_models.load] {name} loaded in {info['load_ms']}ms, rss +{info['rss_mb']}MB")
+        self.start_unload_thread()
+        return model
+
+    def loaded(self, name):
+        return name in self.models
+
+    def prewarm(self, names, delay=0):
+        # load in the background, e.g. the modes the ui is likely to switch to
+        def run():
+            if delay:
+                time.sleep(delay)
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"[cv_models.prewarm] {name} error: {e}")
+        thread = threading.Thread(target=run, daemon=True, name='cv_prewarm')
+        thread.start()
+        return thread
+
+    def unload(self, name):
+        with self.model_lock(name):
+            if self.users.get(name):
+                return False
+            model = self.models.pop(name, None)
+        if model is None:
+            return False
+        close = getattr(model, 'close', None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                print(f"[cv_models.unload] {name} error: {e}")
+        del model
+        gc.collect()
+        print(f"[cv_models.unload] {name} unloaded")
+        return True
+
+    def unload_idle(self, now=None):
+        now = now or time.time()
+        for name in list(self.models):
+            if now - self.info[name]['last_used'] > self.idle_unload:
+                self.unload(name)
+
+    def start_unload_thread(self):
+        if not self.idle_unload or self.unload_thread is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(min(self.CHECK_INTERVAL, self.idle_unload))
+                self.unload_idle()
+        self.unload_thread = threading.Thread(target=run, daemon=True, name='cv_model_unload')
+        self.unload_thread.start()
+
+    def stats(self):
+        now = time.time()
+        stats = {}
+        for name, info in list(self.info.items()):
+            stats[name] = {
+                'loaded': name in self.models,
+                'loads': info['loads'],
+                'load_ms': info['load_ms'],
+                'rss_mb': info['rss_mb'],
+                'idle_s': round(now - info['last_used'], 1)
+            }
+        failures = {name: {'error': failure['error'], 'count': failure['count'],
+                           'retry_in_s': round(max(0, failure['retry_at'] - now), 1)}
+                    for name, failure in list(self.failures.items())}
+        return {'idle_unload': self.idle_unload, 'models': stats, 'failures': failures}
@@ -0,0 +1,133 @@
+import cv2
+import numpy as np
+
+
+def fit_color(color, channels):
+    # cv2 drawing pads short colors with 0, numpy assignment does not
+    color = tuple(color)
+    if channels > len(color):
+        return color + (0,) * (channels - len(color))
+    return color[:channels]
+
+
+class DisplayList():
+    """primitives produced by the cv funcs, drawn straight onto the output frame.
+    only the pixels covered by the primitives are touched, so no full-frame
+    overlay buffer, mask or blend is needed per frame."""
+    def __init__(self):
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def rectangle(self, pt1, pt2, color, thickness=1):
+        self.items.append(('rect', pt1, pt2, color, thickness))
+
+    def circle(self, center, radius, color, thickness=1):
+        self.items.append(('circle', center, radius, color, thickness))
+
+    def line(self, pt1, pt2, color, thickness=1):
+        self.items.append(('line', pt1, pt2, color, thickness))
+
+    def text(self, text, org, size, color, thickness=1):
+        self.items.append(('text', str(text), org, size, color, thickness))
+
+    def mask(self, mask, color, origin=(0, 0), scale=1):
+        # binary mask painted with a flat color, origin is its top left corner.
+        # a mask computed on a downscaled frame is stretched by scale when drawn
+        self.items.append(('mask', mask, origin, color, scale))
+
+    def landmarks(self, points, connections=None, point_color=(0, 0, 255), line_color=(255, 255, 255), radius=2, thickness=2):
+        # points: (N, 2) pixel coordinates, connections: pairs of point indexes
+        points = [(int(x), int(y)) for x, y in points]
+        if connections:
+            for start, end in connections:
+                self.items.append(('line', points[start], points[end], line_color, thickness))
+        for point in points:
+            self.items.append(('circle', point, radius, point_color, -1))
+
+    def draw(self, frame):
+        for item in self.items:
+            kind = item[0]
+            if kind == 'rect':
+                cv2.rectangle(frame, _pt(item[1]), _pt(item[2]), item[3], item[4])
+            elif kind == 'circle':
+                cv2.circle(frame, _pt(item[1]), int(item[2]), item[3], item[4])
+            elif kind == 'line':
+                cv2.line(frame, _pt(item[1]), _pt(item[2]), item[3], item[4])
+            elif kind == 'text':
+                cv2.putText(frame, item[1], _pt(item[2]), cv2.FONT_HERSHEY_SIMPLEX, item[3], item[4], item[5])
+            elif kind == 'mask':
+                self._draw_mask(frame, item[1], item[2], item[3], item[4])
+        return frame
+
+    def _draw_mask(self, frame, mask, origin, color, scale=1):
+        if scale != 1:
+            mask = cv2.resize(mask, (round(mask.shape[1] * scale), round(mask.shape[0] * scale)),
+                              interpolation=cv2.INTER_NEAREST)
+        x, y = _pt(origin)
+        h = min(mask.shape[0], frame.shape[0] - y)
+        w = min(mask.shape[1], frame.shape[1] - x)
+        if h <= 0 or w <= 0:
+            return
+        roi = frame[y:y+h, x:x+w]
+        channels = roi.shape[2] if roi.ndim == 3 else 1
+        roi[mask[:h, :w] > 0] = fit_color(color, channels)
+
+
+def _pt(point):
+    return (int(point[0]), int(point[1]))
+
+
+class TextPanel():
+    """text panel pre-rendered into a BGRA image. it is only rebuilt when
+    its version changes and only its bounding box is blended per frame."""
+    def __init__(self, rect, bg_color=None, bg_alpha=0.5):
+        self.rect = rect
+        self.bg_color = bg_color
+        self.bg_alpha = bg_alpha
+        self.version = None
+        self.channels = None
+        self.panel = None
+        self.text_mask = None
+        self.text_img = None
+        self.bg_img = None
+
+    def build(self, lines, channels):
+        x0, y0, x1, y1 = self.rect
+        h, w = y1 - y0, x1 - x0
+        self.panel = np.zeros((h, w, 4), dtype=np.uint8)
+        if self.bg_color is not None:
+            self.panel[:, :, :3] = self.bg_color
+            self.panel[:, :, 3] = int(255 * self.bg_alpha)
+        for text, org, size, color in lines:
+            cv2.putText(self.panel, str(text), (org[0] - x0, org[1] - y0),
+                        cv2.FONT_HERSHEY_SIMPLEX, size, fit_color(color, 3) + (255,), 1)
+        self.text_mask = self.panel[:, :, 3] == 255
+        text_img = np.ascontiguousarray(self.panel[:, :, :3])
+        if channels > 3:
+            text_img = cv2.cvtColor(text_img, cv2.COLOR_BGR2BGRA)
+        self.text_img = text_img
+        if self.bg_color is not None:
+            self.bg_img = np.empty((h, w, channels), dtype=np.uint8)
+            self.bg_img[:] = fit_color(self.bg_color, channels)
+        self.channels = channels
+
+    def render(self, frame, version, get_lines, origin=(0, 0)):
+        # origin: where the frame sits in panel coordinates, e.g. a zoom crop
+        channels = frame.shape[2]
+        if version != self.version or channels != self.channels:
+            self.build(get_lines(), channels)
+            self.version = version
+        x0, y0, x1, y1 = self.rect
+        fx0, fy0 = max(x0 - origin[0], 0), max(y0 - origin[1], 0)
+        fx1, fy1 = min(x1 - origin[0], frame.shape[1]), min(y1 - origin[1], frame.shape[0])
+        if fx1 <= fx0 or fy1 <= fy0:
+            return frame
+        px0, py0 = fx0 + origin[0] - x0, fy0 + origin[1] - y0
+        panel_slice = (slice(py0, py0 + fy1 - fy0), slice(px0, px0 + fx1 - fx0))
+        roi = frame[fy0:fy1, fx0:fx1]
+        if self.bg_img is not None:
+            cv2.addWeighted(roi, 1 - self.bg_alpha, self.bg_img[panel_slice], self.bg_alpha, 0, dst=roi)
+        np.copyto(roi, self.text_img[panel_slice], where=self.text_mask[panel_slice][:, :, None])
+        return frame
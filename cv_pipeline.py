@@ -0,0 +1,200 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cv_worker import FrameMailbox
+
+
+class Stage():
+    """one cv func run by the CvPipeline.
+    rate is the target runs per second, None runs on every frame. stages with
+    a lower priority number are served first and degraded last. a stage never
+    overlaps itself."""
+    def __init__(self, name, func, rate=30, priority=1):
+        self.name = name
+        self.func = func
+        self.rate = rate
+        self.priority = priority
+        # share of rate currently granted by the budget
+        self.degrade = 1.0
+        self.busy = False
+        self.next_run = 0
+        self.cost = 0
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_seq = 0
+
+    def due(self, now):
+        return now >= self.next_run
+
+    def target_rate(self, frame_rate):
+        return frame_rate if self.rate is None else self.rate
+
+    def schedule(self, now, frame_rate):
+        if self.rate is None and self.degrade == 1:
+            return
+        # advance by whole intervals so frame jitter averages out,
+        # but never bank more than one interval after a stall
+        interval = 1 / max(self.target_rate(frame_rate) * self.degrade, 1e-3)
+        self.next_run = max(self.next_run + interval, now - interval)
+
+    def load(self, frame_rate):
+        # share of one worker this stage takes at its granted rate
+        return self.cost * self.target_rate(frame_rate) * self.degrade
+
+    def stats(self, frame_rate):
+        return {
+            'rate': self.rate,
+            'priority': self.priority,
+            'granted_rate': round(self.target_rate(frame_rate) * self.degrade, 2),
+            'runs': self.runs,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'cost_ms': round(self.cost * 1000, 2),
+            'last_seq': self.last_seq
+        }
+
+
+class CvPipeline(threading.Thread):
+    """runs several cv stages on the same frames across a worker pool.
+    frames come in through a FrameMailbox. make_prep(frame) builds the shared
+    preprocessing for a frame, every due stage reads from it. on_result(name,
+    result, frame) gets each stage result on the worker that produced it.
+    when the stages need more than budget of the pool, the lowest priority
+    stage gets its rate cut first. rates are given back highest priority first
+    once there is room again."""
+    ADJUST_INTERVAL = 0.5
+    MIN_DEGRADE = 0.1
+
+    def __init__(self, make_prep, on_result, workers=2, budget=0.8):
+        super(CvPipeline, self).__init__(daemon=True)
+        self.make_prep = make_prep
+        self.on_result = on_result
+        self.workers = workers
+        self.budget = budget
+        self.mailbox = FrameMailbox()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cv_stage')
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.last_adjust = 0
+        # ewma of the incoming frame rate, what a stage without a rate runs at
+        self.frame_rate = 30.0
+        self.last_frame = None
+        self.__flag = threading.Event()
+        self.__flag.set()
+
+    def set_stage(self, name, func, rate, priority):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None or stage.func != func:
+                self.stages[name] = Stage(name, func, rate, priority)
+            else:
+                stage.rate = rate
+                stage.priority = priority
+
+    def remove_stage(self, name):
+        with self.lock:
+            self.stages.pop(name, None)
+
+    def names(self):
+        with self.lock:
+            return list(self.stages)
+
+    def submit(self, image, seq, timestamp=None, lores=None):
+        if self.ident is None:
+            self.start()
+        self.mailbox.post(image, seq, timestamp, lores)
+
+    def load(self):
+        with self.lock:
+            return sum(stage.load(self.frame_rate) for stage in self.stages.values()) / self.workers
+
+    def stats(self):
+        with self.lock:
+            stages = {name: stage.stats(self.frame_rate) for name, stage in self.stages.items()}
+        return {
+            'workers': self.workers,
+            'frame_rate': round(self.frame_rate, 1),
+            'budget': self.budget,
+            'load': round(self.load(), 3),
+            'posted': self.mailbox.posted,
+            'dropped': self.mailbox.dropped,
+            'stages': stages
+        }
+
+    def stop(self):
+        self.__flag.clear()
+
+    def adjust(self, now):
+        # one step per interval, so the cost estimates catch up with the new rates
+        if now - self.last_adjust < self.ADJUST_INTERVAL:
+            return
+        self.last_adjust = now
+        load = sum(stage.load(self.frame_rate) for stage in self.stages.values()) / self.workers
+        by_priority = sorted(self.stages.values(), key=lambda stage: stage.priority)
+        if load > self.budget:
+            for stage in reversed(by_priority):
+                if stage.degrade > self.MIN_DEGRADE:
+                    stage.degrade = max(stage.degrade * 0.7, self.MIN_DEGRADE)
+                    break
+        elif load < self.budget * 0.8:
+            for stage in by_priority:
+                if stage.degrade < 1:
+                    stage.degrade = min(stage.degrade * 1.25, 1.0)
+                    break
+
+    def run(self):
+        while self.__flag.is_set():
+            frame = self.mailbox.take(timeout=0.5)
+            if frame is None:
+                continue
+            now = time.time()
+            if self.last_frame is not None and now > self.last_frame:
+                self.frame_rate = self.frame_rate * 0.9 + 0.1 / (now - self.last_frame)
+            self.last_frame = now
+            with self.lock:
+                self.adjust(now)
+                due = []
+                for stage in sorted(self.stages.values(), key=lambda stage: stage.priority):
+                    if not stage.due(now):
+                        continue
+                    if stage.busy:
+                        stage.skipped += 1
+                        continue
+                    stage.busy = True
+                    stage.schedule(now, self.frame_rate)
+                    due.append(stage)
+            if not due:
+                self.mailbox.release(frame)
+                continue
+            prep = self.make_prep(frame)
+            # the frame buffer goes back to the mailbox once the last stage is done with it
+            pending = [len(due)]
+            pending_lock = threading.Lock()
+
+            def done():
+                with pending_lock:
+                    pending[0] -= 1
+                    last = pending[0] == 0
+                if last:
+                    self.mailbox.release(frame)
+
+            for stage in due:
+                self.executor.submit(self.run_stage, stage, frame, prep, done)
+
+    def run_stage(self, stage, frame, prep, done):
+        start_time = time.perf_counter()
+        try:
+            result = stage.func(prep)
+            self.on_result(stage.name, result, frame)
+        except Exception as e:
+            stage.errors += 1
+            print(f"[cv_pipeline.run_stage] {stage.name} error: {e}")
+        finally:
+            cost = time.perf_counter() - start_time
+            stage.cost = cost if stage.runs == 0 else stage.cost * 0.9 + cost * 0.1
+            stage.runs += 1
+            stage.last_seq = frame.seq
+            stage.busy = False
+            done()
@@ -0,0 +1,86 @@
+import bisect
+import time
+
+# bucket upper bounds in ns, 1us .. ~10s with ~12% steps
+BUCKET_BOUNDS = [int(1000 * 1.12 ** i) for i in range(143)]
+
+
+class Histogram():
+    """latency histogram with one writer and any number of readers.
+    the writer only increments list items and ints, readers copy them
+    without a lock and at worst see a sample that is still being added."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, counts, q):
+        target = q * sum(counts)
+        seen = 0
+        for i, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if bucket_count and seen >= target:
+                # a bucket bound can lie above anything recorded in it
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return 0
+
+    def summary(self):
+        counts = list(self.counts)
+        count = self.count
+        return {
+            'count': count,
+            'mean_ms': round(self.total / count / 1e6, 3) if count else 0,
+            'p50_ms': round(self.percentile(counts, 0.5) / 1e6, 3),
+            'p95_ms': round(self.percentile(counts, 0.95) / 1e6, 3),
+            'max_ms': round(self.max / 1e6, 3)
+        }
+
+
+class FrameProfiler():
+    """per stage timings of the frame loop.
+    t = profiler.start() once per frame, then t = profiler.lap('stage', t)
+    after each stage. while disabled both return 0 right away."""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            # a fresh dict, readers may still hold the old one
+            self.stages = {}
+        self.enabled = enabled
+
+    def start(self):
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def lap(self, stage, t):
+        if not t:
+            return self.start()
+        now = time.perf_counter_ns()
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.record(now - t)
+        return now
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'stages': {stage: histogram.summary() for stage, histogram in list(self.stages.items())}
+        }
+
+    def hud_lines(self, origin=(0, 0), line_height=14):
+        # text lines for a TextPanel, p50 / p95 / max in ms
+        lines = [('stage        p50    p95    max', origin, 0.4, (255, 255, 255))]
+        for i, (stage, summary) in enumerate(self.stats()['stages'].items()):
+            lines.append(('{:<10} {:>6.2f} {:>6.2f} {:>6.2f}'.format(stage, summary['p50_ms'], summary['p95_ms'], summary['max_ms']),
+                          (origin[0], origin[1] + (i + 1) * line_height), 0.4, (255, 255, 255)))
+        return lines
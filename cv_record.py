@@ -0,0 +1,149 @@
+import cv2
+import imageio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class VideoRecorder():
+    """video file writer running in its own thread.
+    frames come in through a bounded queue, when the writer falls behind
+    frames are dropped by drop_policy instead of stalling the stream:
+    'oldest' drops the oldest queued frame, 'newest' drops the incoming one."""
+    def __init__(self, queue_size=8, drop_policy='oldest'):
+        self.queue_size = queue_size
+        self.drop_policy = drop_policy
+        self.frame_queue = None
+        self.writer_thread = None
+        self.recording = False
+        self.filename = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_time = 0
+
+    def stats(self):
+        return {
+            'recording': self.recording,
+            'filename': self.filename,
+            'submitted': self.submitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'queued': self.frame_queue.qsize() if self.frame_queue else 0,
+            'write_ms': round(self.write_time / self.written * 1000, 2) if self.written else 0
+        }
+
+    def start(self, filename, fps=30):
+        if self.recording:
+            return
+        self.reset_stats()
+        self.filename = filename
+        self.frame_queue = queue.Queue(maxsize=self.queue_size)
+        self.recording = True
+        self.writer_thread = threading.Thread(target=self.write_loop, args=(filename, fps, self.frame_queue), daemon=True)
+        self.writer_thread.start()
+
+    def submit(self, frame):
+        # the frame is passed by reference, the caller must not write to it afterwards
+        if not self.recording:
+            return False
+        self.submitted += 1
+        if self.put_frame(frame):
+            return True
+        self.dropped += 1
+        return False
+
+    def put_frame(self, item):
+        try:
+            self.frame_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            if self.drop_policy == 'newest' and item is not None:
+                return False
+        try:
+            self.frame_queue.get_nowait()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+        try:
+            self.frame_queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def stop(self):
+        if not self.recording:
+            return
+        self.recording = False
+        while not self.put_frame(None):
+            pass
+        print(f"[cv_record.stop] {self.stats()}")
+
+    def write_loop(self, filename, fps, frame_queue):
+        writer = imageio.get_writer(filename, fps=fps)
+        frame_size = None
+        try:
+            while True:
+                frame = frame_queue.get()
+                if frame is None:
+                    break
+                start_time = time.time()
+                if frame.ndim == 3 and frame.shape[2] == 4:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
+                else:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if frame_size is None:
+                    frame_size = (frame.shape[1], frame.shape[0])
+                elif (frame.shape[1], frame.shape[0]) != frame_size:
+                    # zoom changed while recording, keep the file frame size constant
+                    frame = cv2.resize(frame, frame_size)
+                writer.append_data(frame)
+                self.written += 1
+                self.write_time += time.time() - start_time
+        except Exception as e:
+            print(f"[cv_record.write_loop] error: {e}")
+        finally:
+            writer.close()
+
+
+class PhotoWriter():
+    """jpeg photo writer backed by a thread pool, the stream never waits
+    on cv2.imwrite. capture_ms is the time from the request until the frame
+    was grabbed, encode_ms the time spent writing the file(s)."""
+    def __init__(self, max_workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='photo_writer')
+        self.last_stats = {}
+
+    def stats(self):
+        return self.last_stats
+
+    def write(self, filename, frame, request_time=None):
+        # the frame is passed by reference, the caller must not write to it afterwards
+        capture_time = time.time()
+        return self.executor.submit(self.write_files, [filename], [frame], request_time or capture_time, capture_time)
+
+    def write_burst(self, filename_prefix, frames, request_time=None):
+        capture_time = time.time()
+        filenames = [f'{filename_prefix}_{i:02d}.jpg' for i in range(len(frames))]
+        return self.executor.submit(self.write_files, filenames, frames, request_time or capture_time, capture_time)
+
+    def write_files(self, filenames, frames, request_time, capture_time):
+        start_time = time.time()
+        written = []
+        for filename, frame in zip(filenames, frames):
+            try:
+                if cv2.imwrite(filename, frame):
+                    written.append(filename)
+            except Exception as e:
+                print(f"[cv_record.write_files] error: {e}")
+        self.last_stats = {
+            'files': written,
+            'capture_ms': round((capture_time - request_time) * 1000, 2),
+            'encode_ms': round((time.time() - start_time) * 1000, 2)
+        }
+        print(f"[cv_record.write_files] {self.last_stats}")
+        return written
@@ -0,0 +1,605 @@
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# trackers that carry boxes from one frame to the next between detections.
+# the box trackers take (N, 4) x, y, w, h like detect_faces, the SortTracker
+# x0, y0, x1, y1 like detect_objects, in the coordinates they were given.
+
+
+class FlowBoxTracker():
+    """follows boxes with pyramidal lk optical flow on a few corners inside each
+    box. the box moves by the median point motion and scales by the median
+    change of the distances between its points. points that don't flow back
+    to where they started are dropped, a box with too few left is lost."""
+    MAX_POINTS = 30
+    MIN_POINTS = 4
+    FB_ERROR = 1.0
+
+    def __init__(self):
+        self.prev = None
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+        self.points = []
+
+    def box_points(self, gray, box):
+        x, y, w, h = np.round(box).astype(int)
+        x, y = max(x, 0), max(y, 0)
+        roi = gray[y:y + h, x:x + w]
+        if roi.shape[0] < 4 or roi.shape[1] < 4:
+            return np.zeros((0, 2), dtype=np.float32)
+        corners = cv2.goodFeaturesToTrack(roi, self.MAX_POINTS, 0.01, 3)
+        if corners is None:
+            return np.zeros((0, 2), dtype=np.float32)
+        return corners.reshape(-1, 2) + np.float32([x, y])
+
+    def init(self, gray, boxes):
+        # gray can be a view of a reused frame buffer (the lores mailbox slot), keep a copy
+        self.prev = gray.copy()
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.points = [self.box_points(gray, box) for box in self.boxes]
+
+    def update(self, gray):
+        # -> (N, 4) float32 boxes still followed, mask of the boxes kept
+        kept = np.zeros(len(self.boxes), dtype=bool)
+        if not len(self.boxes) or not sum(len(points) for points in self.points):
+            self.init(gray, self.boxes[kept])
+            return self.boxes, kept
+        owner = np.concatenate([np.full(len(points), i) for i, points in enumerate(self.points)])
+        p0 = np.concatenate(self.points).reshape(-1, 1, 2).astype(np.float32)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.prev, gray, p0, None, winSize=(15, 15), maxLevel=2)
+        p0r, status_back, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev, p1, None, winSize=(15, 15), maxLevel=2)
+        good = (status.ravel() == 1) & (status_back.ravel() == 1) & \
+               (np.abs(p0 - p0r).reshape(-1, 2).max(axis=1) < self.FB_ERROR)
+        p0 = p0.reshape(-1, 2)
+        p1 = p1.reshape(-1, 2)
+        height, width = gray.shape[:2]
+        boxes = []
+        points = []
+        for i, box in enumerate(self.boxes):
+            select = good & (owner == i)
+            if select.sum() < self.MIN_POINTS:
+                continue
+            old, new = p0[select], p1[select]
+            shift = np.median(new - old, axis=0)
+            pairs = np.triu_indices(len(old), 1)
+            old_dist = np.linalg.norm(old[pairs[0]] - old[pairs[1]], axis=1)
+            new_dist = np.linalg.norm(new[pairs[0]] - new[pairs[1]], axis=1)
+            valid = old_dist > 1
+            scale = float(np.median(new_dist[valid] / old_dist[valid])) if valid.any() else 1.0
+            x, y, w, h = box
+            cx, cy = x + w / 2 + shift[0], y + h / 2 + shift[1]
+            w, h = w * scale, h * scale
+            # gone once its center leaves the frame
+            if not (0 <= cx < width and 0 <= cy < height):
+                continue
+            kept[i] = True
+            boxes.append((cx - w / 2, cy - h / 2, w, h))
+            # top up the corners once half of them are gone
+            points.append(new if len(new) >= self.MAX_POINTS // 2 else self.box_points(gray, boxes[-1]))
+        self.prev = gray.copy()
+        self.boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+        self.points = points
+        return self.boxes, kept
+
+
+class OpencvBoxTracker():
+    """one opencv single object tracker per box, kcf or mosse.
+    both come with opencv-contrib, create() -> None without it."""
+    FACTORIES = {
+        'kcf': ('TrackerKCF_create', 'legacy.TrackerKCF_create'),
+        'mosse': ('legacy.TrackerMOSSE_create', 'TrackerMOSSE_create')
+    }
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.trackers = []
+        self.boxes = np.zeros((0, 4), dtype=np.float32)
+
+    @classmethod
+    def create(cls, kind):
+        for path in cls.FACTORIES[kind]:
+            factory = cv2
+            for part in path.split('.'):
+                factory = getattr(factory, part, None)
+                if factory is None:
+                    break
+            if factory is not None:
+                return cls(factory)
+        return None
+
+    def init(self, gray, boxes):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.trackers = []
+        for box in self.boxes:
+            tracker = self.factory()
+            tracker.init(gray, tuple(int(v) for v in np.round(box)))
+            self.trackers.append(tracker)
+
+    def update(self, gray):
+        kept = np.zeros(len(self.trackers), dtype=bool)
+        boxes = []
+        trackers = []
+        for i, tracker in enumerate(self.trackers):
+            success, box = tracker.update(gray)
+            if success:
+                kept[i] = True
+                boxes.append(box)
+                trackers.append(tracker)
+        self.trackers = trackers
+        self.boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+        return self.boxes, kept
+
+
+def create_box_tracker(kind):
+    # kind: flow, kcf, mosse or none -> a tracker or None to detect on every frame
+    if kind == 'none':
+        return None
+    if kind == 'flow':
+        return FlowBoxTracker()
+    tracker = OpencvBoxTracker.create(kind)
+    if tracker is None:
+        print(f"[cv_track.create_box_tracker] {kind} needs opencv-contrib, using flow")
+        return FlowBoxTracker()
+    return tracker
+
+
+class DetectTrack():
+    """runs detect(image) every interval frames, or as soon as the tracker lost
+    a box or there is nothing to track, and follows the boxes with the tracker
+    on the frames in between. update(image) -> (boxes, detected)."""
+    def __init__(self, detect, interval=5, tracker='flow'):
+        self.detect = detect
+        self.interval = interval
+        self.tracker = create_box_tracker(tracker)
+        self.since_detect = 0
+        self.shape = None
+        self.frames = 0
+        self.detections = 0
+        self.losses = 0
+
+    def update(self, image):
+        self.frames += 1
+        if self.tracker is not None and self.shape == image.shape and self.since_detect < self.interval \
+                and len(self.tracker.boxes):
+            boxes, kept = self.tracker.update(image)
+            if kept.all():
+                self.since_detect += 1
+                return boxes, False
+            self.losses += 1
+        boxes = self.detect(image)
+        self.detections += 1
+        self.since_detect = 1
+        self.shape = image.shape
+        if self.tracker is not None:
+            self.tracker.init(image, boxes)
+        return boxes, True
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'detections': self.detections,
+            'losses': self.losses,
+            'interval': self.interval
+        }
+
+
+def iou_matrix(boxes_a, boxes_b):
+    # (N, 4) x0, y0, x1, y1 against (M, 4) -> (N, M) intersection over union
+    x0 = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    y0 = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    x1 = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    y1 = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def box_to_z(boxes):
+    # x0, y0, x1, y1 -> center x, center y, area, aspect ratio
+    w = boxes[:, 2] - boxes[:, 0]
+    h = np.maximum(boxes[:, 3] - boxes[:, 1], 1e-6)
+    return np.stack([boxes[:, 0] + w / 2, boxes[:, 1] + h / 2, w * h, w / h], axis=1)
+
+
+def z_to_box(z):
+    w = np.sqrt(np.maximum(z[:, 2] * z[:, 3], 0))
+    h = z[:, 2] / np.maximum(w, 1e-6)
+    return np.stack([z[:, 0] - w / 2, z[:, 1] - h / 2, z[:, 0] + w / 2, z[:, 1] + h / 2], axis=1)
+
+
+class SortTracker():
+    """sort style multi object tracker for (N, 6) class_id, confidence, x0, y0, x1, y1
+    detections. each track is a constant velocity kalman filter over center,
+    area and aspect ratio, all tracks are predicted and corrected at once.
+    detections are matched to tracks of the same class greedily by iou.
+    update(detections) after an inference, predict() on the frames without one,
+    both -> (M, 7) track_id, class_id, confidence, x0, y0, x1, y1 of the tracks
+    confirmed by min_hits matches. a track is dropped after max_age inferences
+    without a match."""
+    F = np.eye(7, dtype=np.float64)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1
+    Q = np.diag([1, 1, 1, 1, 0.01, 0.01, 0.0001])
+    R = np.diag([1, 1, 10, 10])
+    P0 = np.diag([10, 10, 10, 10, 10000, 10000, 10000])
+    ACQUIRE_INTERVAL = 2
+
+    def __init__(self, interval=3, max_age=3, min_hits=2, iou_threshold=0.3):
+        self.interval = interval
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        # per track: id, class, confidence, hits, misses, first seen, last seen
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.classes = np.zeros(0, dtype=np.int64)
+        self.confidences = np.zeros(0)
+        self.hits = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0)
+        self.last_seen = np.zeros(0)
+        self.next_id = 1
+        # frames since the last inference, counting that frame
+        self.since_inference = interval
+        self.stale = False
+        self.counts = {}
+        self.lifetimes = {}
+
+    def inference_due(self):
+        # sooner while there is nothing confirmed or a track waits for confirmation,
+        # but at most every ACQUIRE_INTERVAL frames, flickering false positives
+        # would otherwise run the detector on every frame
+        if self.since_inference >= self.interval or self.stale:
+            return True
+        acquiring = not (self.hits >= self.min_hits).any() or (self.hits < self.min_hits).any()
+        return acquiring and self.since_inference >= self.ACQUIRE_INTERVAL
+
+    def predict_state(self):
+        # keep the area from going negative
+        shrinking = self.x[:, 2] + self.x[:, 6] <= 0
+        self.x[shrinking, 6] = 0
+        self.x = self.x @ self.F.T
+        self.P = np.einsum('ij,tjk,lk->til', self.F, self.P, self.F) + self.Q
+
+    def predict(self, frame_size=None):
+        self.since_inference += 1
+        if len(self.ids):
+            self.predict_state()
+        tracks = self.tracks()
+        if frame_size is not None and len(tracks):
+            # a track about to leave the frame needs a fresh detection
+            cx = (tracks[:, 3] + tracks[:, 5]) / 2
+            cy = (tracks[:, 4] + tracks[:, 6]) / 2
+            self.stale = bool(((cx < 0) | (cx >= frame_size[0]) | (cy < 0) | (cy >= frame_size[1])).any())
+        return tracks
+
+    def match(self, boxes, classes):
+        # -> (track, detection) pairs, best iou first, same class only
+        if not len(self.ids) or not len(boxes):
+            return []
+        iou = iou_matrix(z_to_box(self.x[:, :4]), boxes)
+        iou[self.classes[:, None] != classes[None, :]] = 0
+        pairs = []
+        used_tracks = set()
+        used_detections = set()
+        order = np.argsort(-iou, axis=None)
+        for track, detection in zip(*np.unravel_index(order, iou.shape)):
+            if iou[track, detection] < self.iou_threshold:
+                break
+            if track in used_tracks or detection in used_detections:
+                continue
+            used_tracks.add(track)
+            used_detections.add(detection)
+            pairs.append((track, detection))
+        return pairs
+
+    def update(self, detections, now=None):
+        now = now or time.time()
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+        self.since_inference = 1
+        self.stale = False
+        if len(self.ids):
+            self.predict_state()
+        pairs = self.match(detections[:, 2:6], detections[:, 0].astype(np.int64))
+        matched = np.zeros(len(self.ids), dtype=bool)
+        if pairs:
+            tracks, rows = map(np.array, zip(*pairs))
+            matched[tracks] = True
+            # kalman correction of the matched tracks
+            P = self.P[tracks]
+            S = P[:, :4, :4] + self.R
+            K = P[:, :, :4] @ np.linalg.inv(S)
+            residual = box_to_z(detections[rows, 2:6]) - self.x[tracks, :4]
+            self.x[tracks] += np.einsum('tij,tj->ti', K, residual)
+            self.P[tracks] = P - K @ P[:, :4, :]
+            self.confidences[tracks] = detections[rows, 1]
+            self.hits[tracks] += 1
+            self.misses[tracks] = 0
+            self.last_seen[tracks] = now
+            for track in tracks[self.hits[tracks] == self.min_hits]:
+                class_id = int(self.classes[track])
+                self.counts[class_id] = self.counts.get(class_id, 0) + 1
+        self.misses[~matched] += 1
+        self.drop(self.misses > self.max_age)
+        new = np.ones(len(detections), dtype=bool)
+        for _, row in pairs:
+            new[row] = False
+        self.add(detections[new], now)
+        return self.tracks()
+
+    def add(self, detections, now):
+        count = len(detections)
+        if not count:
+            return
+        x = np.zeros((count, 7))
+        x[:, :4] = box_to_z(detections[:, 2:6])
+        self.x = np.concatenate([self.x, x])
+        self.P = np.concatenate([self.P, np.repeat(self.P0[None], count, axis=0)])
+        self.ids = np.concatenate([self.ids, np.arange(self.next_id, self.next_id + count)])
+        self.next_id += count
+        self.classes = np.concatenate([self.classes, detections[:, 0].astype(np.int64)])
+        self.confidences = np.concatenate([self.confidences, detections[:, 1]])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int64)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int64)])
+        self.first_seen = np.concatenate([self.first_seen, np.full(count, now)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(count, now)])
+        if self.min_hits <= 1:
+            for class_id in detections[:, 0].astype(np.int64):
+                self.counts[int(class_id)] = self.counts.get(int(class_id), 0) + 1
+
+    def drop(self, remove):
+        if not remove.any():
+            return
+        for track in np.nonzero(remove & (self.hits >= self.min_hits))[0]:
+            lifetimes = self.lifetimes.setdefault(int(self.classes[track]), deque(maxlen=100))
+            lifetimes.append(self.last_seen[track] - self.first_seen[track])
+        keep = ~remove
+        for name in ('x', 'P', 'ids', 'classes', 'confidences', 'hits', 'misses', 'first_seen', 'last_seen'):
+            setattr(self, name, getattr(self, name)[keep])
+
+    def tracks(self):
+        confirmed = (self.hits >= self.min_hits) & (self.misses == 0)
+        tracks = np.empty((int(confirmed.sum()), 7), dtype=np.float32)
+        tracks[:, 0] = self.ids[confirmed]
+        tracks[:, 1] = self.classes[confirmed]
+        tracks[:, 2] = self.confidences[confirmed]
+        tracks[:, 3:7] = z_to_box(self.x[confirmed, :4])
+        return tracks
+
+    def stats(self, class_names=None):
+        name = lambda class_id: class_names[class_id] if class_names else str(class_id)
+        active = {}
+        for class_id in self.classes[(self.hits >= self.min_hits) & (self.misses == 0)]:
+            active[name(int(class_id))] = active.get(name(int(class_id)), 0) + 1
+        lifetimes = {}
+        for class_id, values in list(self.lifetimes.items()):
+            values = list(values)
+            lifetimes[name(class_id)] = {'tracks': len(values),
+                                         'mean_s': round(sum(values) / len(values), 2),
+                                         'max_s': round(max(values), 2)}
+        return {
+            'interval': self.interval,
+            'active': active,
+            'counts': {name(class_id): count for class_id, count in list(self.counts.items())},
+            'lifetimes': lifetimes
+        }
+
+
+# bgr -> 15 bit index into a ColorTracker table, 5 bits per channel
+COLOR_BITS = 5
+CHANNEL_LUTS = [((np.arange(256) >> (8 - COLOR_BITS)) << (COLOR_BITS * shift)).astype(np.uint16) for shift in (2, 1, 0)]
+
+
+def build_color_lut(ranges):
+    # (lower, upper) hsv ranges -> 255 for every bgr cell most of which lies in one of them
+    levels = 1 << COLOR_BITS
+    step = 256 // levels
+    offsets = np.array([step // 4, step * 3 // 4])
+    cells = np.arange(levels) * step
+    # 2 x 2 x 2 samples per cell
+    values = (cells[:, None] + offsets[None, :]).ravel()
+    b, g, r = np.meshgrid(values, values, values, indexing='ij')
+    hsv = cv2.cvtColor(np.stack([b, g, r], axis=-1).astype(np.uint8).reshape(-1, 1, 3), cv2.COLOR_BGR2HSV).reshape(-1, 3)
+    inside = np.zeros(len(hsv), dtype=bool)
+    for lower, upper in ranges:
+        inside |= np.all((hsv >= np.asarray(lower)) & (hsv <= np.asarray(upper)), axis=1)
+    votes = inside.reshape(levels, 2, levels, 2, levels, 2).sum(axis=(1, 3, 5))
+    return np.where(votes >= 4, 255, 0).astype(np.uint8).ravel()
+
+
+class ColorTracker():
+    """finds the largest blob of some hsv ranges and follows it.
+    membership is one lookup per pixel in a 32x32x32 bgr table built from the
+    ranges, so there is no per frame hsv conversion and a range may wrap around
+    the hue circle. once found, only a window of window_scale times the blob
+    radius around it is searched, the whole image again after a loss.
+    method camshift follows the hue histogram of the blob with cv2.CamShift
+    inside that window instead of thresholding it.
+    update(bgr) -> (circle center, radius, centroid) in bgr pixels, or None.
+    a fourth channel, the x of xrgb8888 csi frames, is ignored."""
+    MIN_WINDOW = 24
+    HUE_BINS = 16
+
+    def __init__(self, ranges, method='lut', window_scale=3.0, open_kernel=5):
+        self.method = method
+        self.window_scale = window_scale
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (open_kernel, open_kernel)) if open_kernel else None
+        self.frames = 0
+        self.full_searches = 0
+        self.losses = 0
+        self.set_ranges(ranges)
+
+    def set_ranges(self, ranges):
+        self.lut = build_color_lut(ranges)
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.hist = None
+        self.shape = None
+
+    def mask(self, bgr):
+        b, g, r = cv2.split(bgr[..., :3])
+        index = cv2.LUT(b, CHANNEL_LUTS[0])
+        index |= cv2.LUT(g, CHANNEL_LUTS[1])
+        index |= cv2.LUT(r, CHANNEL_LUTS[2])
+        mask = np.take(self.lut, index)
+        if self.kernel is not None:
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        return mask
+
+    def window(self, shape):
+        (cx, cy), radius = self.last
+        half = max(self.MIN_WINDOW, radius * self.window_scale)
+        height, width = shape[:2]
+        return (int(max(0, cx - half)), int(max(0, cy - half)),
+                int(min(width, cx + half + 1)), int(min(height, cy + half + 1)))
+
+    def threshold(self, bgr, offset):
+        mask = self.mask(bgr)
+        cnts = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        if not cnts:
+            return None
+        c = max(cnts, key=cv2.contourArea)
+        moments = cv2.moments(c)
+        if not moments["m00"]:
+            return None
+        (x, y), radius = cv2.minEnclosingCircle(c)
+        if self.method == 'camshift':
+            self.learn_hue(bgr, mask)
+        return ((x + offset[0], y + offset[1]), radius,
+                (moments["m10"] / moments["m00"] + offset[0], moments["m01"] / moments["m00"] + offset[1]))
+
+    def learn_hue(self, bgr, mask):
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        hist = cv2.calcHist([hsv], [0], mask, [self.HUE_BINS], [0, 180])
+        self.hist = cv2.normalize(hist, None, 0, 255, cv2.NORM_MINMAX)
+
+    def camshift(self, bgr, offset):
+        hsv = cv2.cvtColor(bgr, cv2.COLOR_BGR2HSV)
+        back_projection = cv2.calcBackProject([hsv], [0], self.hist, [0, 180], 1)
+        # washed out and dark pixels have no reliable hue
+        back_projection &= cv2.inRange(hsv, (0, 60, 32), (180, 255, 255))
+        (cx, cy), radius = self.last
+        start = (max(0, int(cx - radius - offset[0])), max(0, int(cy - radius - offset[1])),
+                 max(1, int(radius * 2)), max(1, int(radius * 2)))
+        (center, size, _), (x, y, w, h) = cv2.CamShift(back_projection, start,
+                                                      (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1))
+        if w * h < 4 or not back_projection[y:y + h, x:x + w].any():
+            return None
+        center = (center[0] + offset[0], center[1] + offset[1])
+        return center, max(size) / 2, center
+
+    def update(self, bgr):
+        self.frames += 1
+        found = None
+        bgr = bgr[..., :3]
+        if bgr.shape != self.shape:
+            # another process scale, the last find is in other coordinates
+            self.last = None
+            self.shape = bgr.shape
+        if self.last is not None:
+            x0, y0, x1, y1 = self.window(bgr.shape)
+            if self.method == 'camshift' and self.hist is not None:
+                found = self.camshift(bgr[y0:y1, x0:x1], (x0, y0))
+            else:
+                found = self.threshold(bgr[y0:y1, x0:x1], (x0, y0))
+            if found is None:
+                self.losses += 1
+        if found is None:
+            self.full_searches += 1
+            found = self.threshold(bgr, (0, 0))
+        self.last = None if found is None else (found[2], found[1])
+        return found
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'frames': self.frames,
+            'full_searches': self.full_searches,
+            'losses': self.losses
+        }
+
+
+class OneEuro():
+    """one euro filter over a whole array at once. the cutoff frequency rises
+    with the filtered speed, so a still target loses its jitter and a moving
+    one does not lag. dx is the filtered velocity per second."""
+    def __init__(self, min_cutoff=1.0, beta=0.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = None
+        self.t = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        return 1 / (1 + 1 / (2 * np.pi * cutoff * dt))
+
+    def update(self, x, t):
+        x = np.asarray(x, dtype=np.float32)
+        if self.x is None or self.x.shape != x.shape:
+            self.x = x.copy()
+            self.dx = np.zeros_like(x)
+            self.t = t
+            return self.x
+        dt = t - self.t
+        if dt <= 0:
+            return self.x
+        self.dx += self.alpha(self.d_cutoff, dt) * ((x - self.x) / dt - self.dx)
+        self.x += self.alpha(self.min_cutoff + self.beta * np.abs(self.dx), dt) * (x - self.x)
+        self.t = t
+        return self.x
+
+
+class LandmarkTrack():
+    """decimated landmark detection for the mediapipe modes. the graph runs
+    when inference_due(), every interval frames, update(landmarks) one euro
+    filters its result and predict() extrapolates that along the filtered
+    velocity on the frames in between, for at most max_extrapolate seconds.
+    landmarks are a float array, a change of shape (one hand more or less)
+    starts the filter over and an empty result clears it."""
+    def __init__(self, interval=2, min_cutoff=1.0, beta=0.0, d_cutoff=1.0, max_extrapolate=0.2):
+        self.interval = interval
+        self.max_extrapolate = max_extrapolate
+        self.filter = OneEuro(min_cutoff, beta, d_cutoff)
+        self.empty = None
+        self.since_inference = 0
+        self.frames = 0
+        self.inferences = 0
+
+    def inference_due(self):
+        return self.since_inference >= self.interval or self.inferences == 0
+
+    def update(self, landmarks, now=None):
+        now = time.time() if now is None else now
+        self.frames += 1
+        self.inferences += 1
+        self.since_inference = 1
+        if not len(landmarks):
+            self.filter.reset()
+            self.empty = landmarks
+            return landmarks
+        return self.filter.update(landmarks, now).copy()
+
+    def predict(self, now=None):
+        now = time.time() if now is None else now
+        self.frames += 1
+        self.since_inference += 1
+        if self.filter.x is None:
+            return self.empty
+        return self.filter.x + self.filter.dx * min(now - self.filter.t, self.max_extrapolate)
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'inferences': self.inferences,
+            'interval': self.interval
+        }
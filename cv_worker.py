@@ -0,0 +1,236 @@
+import atexit
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class CvFrame():
+    """frame handed to the cv funcs, tagged with its sequence number and capture time.
+    lores is the small Y plane of the same capture when the camera provides one."""
+    __slots__ = ('image', 'seq', 'timestamp', 'lores')
+
+    def __init__(self, image, seq, timestamp, lores=None):
+        self.image = image
+        self.seq = seq
+        self.timestamp = timestamp
+        self.lores = lores
+
+
+class FrameMailbox():
+    """single slot frame handoff, the newest frame wins.
+    a frame still waiting in the slot when a new one arrives is dropped
+    and its buffer is reused for the new copy."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.slot = None
+        self.spare = None
+        self.posted = 0
+        self.dropped = 0
+
+    def post(self, image, seq, timestamp=None, lores=None):
+        # copy the frame, the caller keeps drawing on its own one
+        timestamp = timestamp or time.time()
+        with self.cond:
+            if self.slot is not None:
+                self.dropped += 1
+                buffer, self.slot = self.slot, None
+            else:
+                buffer, self.spare = self.spare, None
+            if buffer is not None and buffer.image.shape == image.shape and buffer.image.dtype == image.dtype:
+                np.copyto(buffer.image, image)
+                buffer.seq = seq
+                buffer.timestamp = timestamp
+            else:
+                buffer = CvFrame(image.copy(), seq, timestamp)
+            if lores is None:
+                buffer.lores = None
+            elif buffer.lores is not None and buffer.lores.shape == lores.shape:
+                np.copyto(buffer.lores, lores)
+            else:
+                buffer.lores = lores.copy()
+            self.slot = buffer
+            self.posted += 1
+            self.cond.notify()
+
+    def take(self, timeout=None):
+        with self.cond:
+            if self.slot is None:
+                self.cond.wait(timeout)
+            frame, self.slot = self.slot, None
+            return frame
+
+    def release(self, frame):
+        # hand a processed frame back so its buffer can be reused
+        with self.cond:
+            self.spare = frame
+
+
+class ShmFrameRing():
+    """fixed number of frame slots in one multiprocessing shared memory block"""
+    def __init__(self, slots, slot_bytes):
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.lock = threading.Lock()
+        self.free = list(range(slots))
+
+    def acquire(self):
+        with self.lock:
+            return self.free.pop() if self.free else None
+
+    def release(self, slot):
+        with self.lock:
+            self.free.append(slot)
+
+    def idle(self):
+        with self.lock:
+            return len(self.free) == self.slots
+
+    def write(self, slot, image):
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, image)
+        del view
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except Exception as e:
+            print(f"[cv_worker.ShmFrameRing.close] error: {e}")
+
+
+def process_worker_main(project_path, job_queue, result_queue):
+    # runs in a worker process: reads frames straight out of the shared
+    # memory slot and sends back only the compact detection result
+    import cv_detect
+    cv_detect.set_opencv_threads()
+    attached = {}
+    models = {}
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+        shm_name, slot, offset, shape, dtype, seq, timestamp, mode, frame_shape = job
+        result, error = None, None
+        start_time = time.time()
+        try:
+            if shm_name not in attached:
+                for old_shm in attached.values():
+                    old_shm.close()
+                # the resource tracker is the parent's, attaching adds nothing to
+                # unregister, the parent unlinks the block in close()
+                attached = {shm_name: shared_memory.SharedMemory(name=shm_name)}
+            image = np.ndarray(shape, dtype=dtype, buffer=attached[shm_name].buf, offset=offset)
+            if mode not in models:
+                models[mode] = cv_detect.load_model(mode, project_path)
+            prep = cv_detect.FrameCache(image)
+            result = cv_detect.DETECTORS[mode](getattr(prep, cv_detect.DETECTOR_INPUTS[mode])(), models[mode])
+            del image, prep
+        except Exception as e:
+            error = str(e)
+        result_queue.put((seq, timestamp, mode, slot, shm_name, shape, frame_shape, result, error, time.time() - start_time))
+
+
+class CvProcessPool():
+    """runs cv_detect funcs in worker processes over shared memory frames.
+    a frame is dropped when every slot is in flight, results are handed to
+    on_result(seq, timestamp, mode, result, shape, frame_shape) from a collector
+    thread. shape is the image the detector saw, frame_shape the frame it was
+    downscaled from."""
+    def __init__(self, project_path, workers, on_result):
+        self.project_path = project_path
+        self.workers = workers
+        self.on_result = on_result
+        # not fork: the pool is made in a boot thread while other threads run, a
+        # forked worker could inherit a lock one of them held. the forkserver
+        # has cv_detect and cv2 imported once, every worker forks from it
+        self.ctx = multiprocessing.get_context('forkserver')
+        self.ctx.set_forkserver_preload(['cv_detect'])
+        self.job_queue = self.ctx.Queue()
+        self.result_queue = self.ctx.Queue()
+        self.ring = None
+        self.old_rings = {}
+        self.processes = []
+        self.submitted = 0
+        self.dropped = 0
+        self.completed = 0
+        self.errors = 0
+        self.process_time = 0
+        for i in range(workers):
+            process = self.ctx.Process(target=process_worker_main,
+                                       args=(project_path, self.job_queue, self.result_queue),
+                                       name=f'cv_worker_{i}', daemon=True)
+            process.start()
+            self.processes.append(process)
+        self.collector = threading.Thread(target=self.collect_loop, daemon=True)
+        self.collector.start()
+        atexit.register(self.close)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'completed': self.completed,
+            'errors': self.errors,
+            'process_ms': round(self.process_time / self.completed * 1000, 2) if self.completed else 0
+        }
+
+    def submit(self, image, seq, timestamp, mode, frame_shape=None):
+        self.submitted += 1
+        if self.ring is None or image.nbytes > self.ring.slot_bytes:
+            if self.ring is not None and self.ring.idle():
+                self.ring.close()
+            elif self.ring is not None:
+                # frames got bigger, in flight jobs keep the old block until they are done
+                self.old_rings[self.ring.shm.name] = self.ring
+            self.ring = ShmFrameRing(self.workers + 1, image.nbytes)
+        slot = self.ring.acquire()
+        if slot is None:
+            self.dropped += 1
+            return False
+        self.ring.write(slot, image)
+        self.job_queue.put((self.ring.shm.name, slot, slot * self.ring.slot_bytes, image.shape, image.dtype.str,
+                            seq, timestamp, mode, frame_shape or image.shape))
+        return True
+
+    def collect_loop(self):
+        while True:
+            seq, timestamp, mode, slot, shm_name, shape, frame_shape, result, error, process_time = self.result_queue.get()
+            if shm_name in self.old_rings:
+                ring = self.old_rings[shm_name]
+                ring.release(slot)
+                if ring.idle():
+                    ring.close()
+                    del self.old_rings[shm_name]
+            elif self.ring is not None:
+                self.ring.release(slot)
+            if error is not None:
+                self.errors += 1
+                print(f"[cv_worker.CvProcessPool] {mode} error: {error}")
+                continue
+            self.completed += 1
+            self.process_time += process_time
+            try:
+                self.on_result(seq, timestamp, mode, result, shape, frame_shape)
+            except Exception as e:
+                print(f"[cv_worker.CvProcessPool.on_result] error: {e}")
+
+    def close(self):
+        # once, at exit or by the caller, stops the workers and frees the shared memory
+        for process in self.processes:
+            self.job_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        for ring in [self.ring] + list(self.old_rings.values()):
+            if ring is not None:
+                ring.close()
+        self.ring = None
+        self.old_rings = {}
+        atexit.unregister(self.close)
@@ -0,0 +1,37 @@
+from cv_gimbal import GimbalController
+
+DEG_PER_PIXEL = 0.05
+LATENCY = 0.1
+
+
+def run_gimbal(target_pan, frames=40, rate=20):
+    # the gimbal follows each command at once, results arrive LATENCY after the frame
+    sent = []
+    gimbal = GimbalController(lambda *command: sent.append(command), rate, latency=LATENCY, threaded=False)
+    moves = [(0, 0.0)]
+    for frame in range(frames):
+        now = 100 + frame / rate
+        frame_time = now - LATENCY
+        pan = [pan for move_time, pan in moves if move_time <= frame_time][-1]
+        gimbal.observe((target_pan - pan) / DEG_PER_PIXEL, 0, DEG_PER_PIXEL, frame_time, now)
+        command = gimbal.step(now)
+        if command is not None:
+            gimbal.send(*command)
+            moves.append((now, command[0]))
+    return gimbal, sent
+
+
+def test_first_lock_sends_one_command():
+    gimbal, sent = run_gimbal(10)
+    assert len(sent) == 1
+    assert abs(sent[0][0] - 10) < 0.01
+    assert gimbal.suppressed > 0
+
+
+def test_frames_from_before_the_first_command_use_the_starting_pose():
+    gimbal = GimbalController(lambda *command: None, threaded=False)
+    gimbal.reset(5, 0)
+    gimbal.observe(0, 0, DEG_PER_PIXEL, 99.9, 100)
+    gimbal.history.append((100, 20, 0))
+    assert gimbal.pose_at(99.95) == (5, 0)
+    assert gimbal.pose_at(100.5) == (20, 0)
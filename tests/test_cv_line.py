@@ -0,0 +1,16 @@
+from cv_line import LineFollower
+
+
+def test_line_follower_predicts_between_frames():
+    sent = []
+    follower = LineFollower(lambda speed, turning: sent.append((speed, turning)), 60, 0.5, 1.0, 0.1, threaded=False)
+    follower.set_drive(0.3, 0.0, 0.0)
+    follower.set_drive(0.3, 0.1, 1 / 30)
+    # a measurement goes out as it is, then the turn keeps growing until the next frame
+    assert follower.step(1 / 30) == (0.3, 0.1)
+    turns = [follower.step(1 / 30 + i / 60)[1] for i in range(1, 4)]
+    assert turns[0] > 0.1 and turns[1] > turns[0]
+    # held after max_extrapolate, one stop after timeout and nothing after it
+    assert follower.step(0.3) == follower.step(0.4)
+    assert follower.step(0.6) == (0, 0)
+    assert follower.step(0.7) is None
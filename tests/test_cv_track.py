@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+
+from cv_track import ColorTracker, FlowBoxTracker, SortTracker
+
+
+def textured_frame(buffer, x, y, size=60):
+    # a fixed random texture pasted at x, y into buffer, in place like FrameMailbox.post
+    rng = np.random.default_rng(1)
+    patch = rng.integers(0, 255, (size, size), dtype=np.uint8)
+    buffer[:] = 40
+    buffer[y:y + size, x:x + size] = patch
+    return buffer
+
+
+def test_flow_tracker_follows_box_in_reused_buffer():
+    buffer = np.zeros((240, 320), dtype=np.uint8)
+    tracker = FlowBoxTracker()
+    tracker.init(textured_frame(buffer, 50, 80), [(50, 80, 60, 60)])
+    for x in range(54, 70, 4):
+        boxes, kept = tracker.update(textured_frame(buffer, x, 80))
+        assert kept.all()
+    assert abs(boxes[0][0] - 66) < 1.5
+    assert abs(boxes[0][1] - 80) < 1.5
+
+
+def run_sort(tracker, detect, frames):
+    # -> frames the detector ran on
+    inferred = []
+    for frame in range(frames):
+        if tracker.inference_due():
+            tracker.update(detect(frame))
+            inferred.append(frame)
+        else:
+            tracker.predict((640, 480))
+    return inferred
+
+
+def test_sort_tracker_runs_every_interval_frames():
+    tracker = SortTracker(interval=3, max_age=3, min_hits=2)
+    inferred = run_sort(tracker, lambda frame: [(15, 0.9, 100, 100, 200, 200)], 20)
+    # acquiring first, then every third frame once the track is confirmed
+    assert inferred[:2] == [0, 2]
+    assert np.all(np.diff(inferred[2:]) == 3)
+
+
+def test_sort_tracker_flicker_does_not_force_every_frame():
+    tracker = SortTracker(interval=3, max_age=3, min_hits=2)
+    # a confirmed object plus a false positive that never lines up with itself
+    detect = lambda frame: [(15, 0.9, 100, 100, 200, 200), (5, 0.3, 10 + 97 * frame % 400, 300, 40 + 97 * frame % 400, 330)]
+    inferred = run_sort(tracker, detect, 30)
+    assert np.all(np.diff(inferred) >= 2)
+    assert len(inferred) <= 16
+
+
+def test_color_tracker_ignores_fourth_channel():
+    # xrgb8888 csi frames come with a fourth channel
+    bgr = np.full((240, 320, 3), 40, dtype=np.uint8)
+    cv2.circle(bgr, (200, 120), 20, (255, 120, 0), -1)
+    bgra = cv2.cvtColor(bgr, cv2.COLOR_BGR2BGRA)
+    for method in ('lut', 'camshift'):
+        tracker = ColorTracker([(np.array([90, 160, 150]), np.array([105, 255, 255]))], method)
+        assert np.array_equal(tracker.mask(bgra), tracker.mask(bgr))
+        for _ in range(3):
+            found = tracker.update(bgra)
+        assert found is not None
+        assert abs(found[0][0] - 200) < 3 and abs(found[0][1] - 120) < 3